@@ -0,0 +1,472 @@
+"""Запросы к графу постов в стиле GraphQL.
+
+Поддерживается подмножество синтаксиса GraphQL: выборка полей,
+вложенные выборки и аргументы-литералы (числа, строки, true, false,
+null), без переменных, фрагментов и псевдонимов:
+
+    {
+      posts(first: 50, group: "cats") {
+        id text cursor author { username } group { title }
+        comment_count comments(first: 3) { text author { username } }
+      }
+    }
+
+Запрос выполняется по уровням: каждое поле разрешается сразу для всех
+объектов уровня, а связанные объекты загружаются через DataLoader,
+который собирает ключи, убирает повторы и кеширует объекты на время
+запроса. Поэтому число SQL-запросов зависит от формы запроса, но не
+от числа постов. Глубину и стоимость запроса (число значений в ответе
+с учетом аргументов first) ограничивают API_QUERY_MAX_DEPTH и
+API_QUERY_MAX_COST.
+"""
+
+import json
+import re
+from collections import defaultdict
+from typing import (Callable, Dict, Hashable, Iterable, List, NamedTuple,
+                    Optional)
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Model, OuterRef, QuerySet, Subquery
+
+from posts.counters import counted
+from posts.models import Comment, Follow, Group, Post, UserCounters
+from posts.paginators import CursorPaginator, encode_cursor
+from posts.timeline import timeline_posts
+
+User = get_user_model()
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>[\s,]+|\#[^\n]*)
+  | (?P<punct>[{}():])
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<number>-?\d+)
+  | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+''', re.VERBOSE)
+
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+# Наибольший id, который влезает в AutoField во всех поддерживаемых базах.
+MAX_ID = 2 ** 31 - 1
+
+
+class QueryError(ValueError):
+    """Ошибка в запросе: синтаксис, поля, аргументы или лимиты."""
+
+
+class Field(NamedTuple):
+    name: str
+    args: Dict[str, object]
+    selections: List['Field']
+
+
+class Parser:
+    """Разбирает текст запроса в список полей верхнего уровня."""
+
+    def __init__(self, text: str):
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = TOKEN_RE.match(text, position)
+            if match is None:
+                raise QueryError(
+                    f'Неожиданный символ {text[position]!r} '
+                    f'в позиции {position}.')
+            if match.lastgroup != 'space':
+                self.tokens.append((match.lastgroup, match.group()))
+            position = match.end()
+        self.position = 0
+        self.depth = 0
+
+    def peek(self) -> str:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return ''
+
+    def take(self, kind: str, value: Optional[str] = None) -> str:
+        if self.position < len(self.tokens):
+            token_kind, token = self.tokens[self.position]
+            if token_kind == kind and value in (None, token):
+                self.position += 1
+                return token
+        raise QueryError(f'Ожидалось {value or kind}, '
+                         f'получено {self.peek() or "конец запроса"}.')
+
+    def document(self) -> List[Field]:
+        if self.peek() == 'query':
+            self.take('name')
+            if self.peek() not in ('{', ''):
+                self.take('name')
+        fields = self.selection_set()
+        if self.position < len(self.tokens):
+            raise QueryError(f'Лишний текст после запроса: {self.peek()}.')
+        return fields
+
+    def selection_set(self) -> List[Field]:
+        # Глубина проверяется при разборе: слишком глубокий запрос
+        # исчерпал бы стек рекурсии раньше, чем дойдет до check.
+        self.depth += 1
+        if self.depth > settings.API_QUERY_MAX_DEPTH:
+            raise QueryError(f'Глубина запроса больше '
+                             f'{settings.API_QUERY_MAX_DEPTH}.')
+        self.take('punct', '{')
+        fields = [self.field()]
+        while self.peek() != '}':
+            fields.append(self.field())
+        self.take('punct', '}')
+        self.depth -= 1
+        return fields
+
+    def field(self) -> Field:
+        name = self.take('name')
+        args = {}
+        if self.peek() == '(':
+            self.take('punct', '(')
+            while self.peek() != ')':
+                arg = self.take('name')
+                self.take('punct', ':')
+                args[arg] = self.value()
+            self.take('punct', ')')
+        selections = self.selection_set() if self.peek() == '{' else []
+        return Field(name, args, selections)
+
+    def value(self) -> object:
+        kind, token = (self.tokens[self.position]
+                       if self.position < len(self.tokens) else ('', ''))
+        if kind == 'string':
+            self.position += 1
+            try:
+                return json.loads(token)
+            except ValueError:
+                raise QueryError(f'Некорректная строка {token}.')
+        if kind == 'number':
+            self.position += 1
+            return int(token)
+        if kind == 'name' and token in LITERALS:
+            self.position += 1
+            return LITERALS[token]
+        raise QueryError(f'Ожидалось значение аргумента, '
+                         f'получено {token or "конец запроса"}.')
+
+
+class DataLoader:
+    """Загрузка объектов по ключам пачками с кешем на время запроса.
+
+    batch получает список новых ключей и возвращает словарь
+    ключ -> объект; ключей, которых нет в словаре, нет и в базе.
+    """
+
+    def __init__(self, batch: Callable[[List[Hashable]], Dict]):
+        self.batch = batch
+        self.cache: Dict[Hashable, object] = {}
+
+    def prime(self, objects: Iterable[Model]) -> None:
+        for obj in objects:
+            self.cache.setdefault(obj.pk, obj)
+
+    def load_many(self, keys: List[Hashable]) -> List[object]:
+        missing = [key for key in dict.fromkeys(keys)
+                   if key is not None and key not in self.cache]
+        if missing:
+            found = self.batch(missing)
+            for key in missing:
+                self.cache[key] = found.get(key)
+        return [None if key is None else self.cache[key] for key in keys]
+
+
+class Context:
+    """Пользователь запроса и его загрузчики."""
+
+    def __init__(self, user):
+        self.user = user
+        self.loaders: Dict[Hashable, DataLoader] = {}
+
+    def loader(self, name: Hashable,
+               batch: Callable[[List[Hashable]], Dict]) -> DataLoader:
+        if name not in self.loaders:
+            self.loaders[name] = DataLoader(batch)
+        return self.loaders[name]
+
+
+class Resolver(NamedTuple):
+    """Поле типа.
+
+    resolve(context, objects, args) возвращает значения поля для всех
+    объектов уровня в том же порядке. type - тип значений-объектов
+    (None для скаляров), many - значение поля - список объектов.
+    """
+    resolve: Callable[[Context, List, Dict], List]
+    type: Optional[str] = None
+    many: bool = False
+
+
+def first(args: Dict[str, object]) -> int:
+    """Размер списка из аргумента first."""
+    value = args.get('first', settings.POSTS_PER_PAGE)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise QueryError('first должен быть положительным числом.')
+    return min(value, settings.API_MAX_LIMIT)
+
+
+def string_arg(args: Dict[str, object], name: str) -> Optional[str]:
+    value = args.get(name)
+    if value is not None and not isinstance(value, str):
+        raise QueryError(f'{name} должен быть строкой.')
+    return value
+
+
+def attr(name: str) -> Resolver:
+    return Resolver(lambda context, objects, args: [
+        getattr(obj, name) for obj in objects])
+
+
+def by_pk(model) -> Callable[[List], Dict]:
+    return lambda keys: model.objects.in_bulk(keys)
+
+
+def load_users(context: Context, keys: List[int]) -> List:
+    return context.loader('users', by_pk(User)).load_many(keys)
+
+
+def load_posts(context: Context, keys: List[int]) -> List:
+    return context.loader('posts', by_pk(Post)).load_many(keys)
+
+
+def load_groups(context: Context, keys: List[int]) -> List:
+    return context.loader('groups', by_pk(Group)).load_many(keys)
+
+
+def related(key: str, type_name: str, load: Callable) -> Resolver:
+    """Объект по внешнему ключу key через загрузчик load."""
+    return Resolver(lambda context, objects, args: load(
+        context, [getattr(obj, key) for obj in objects]), type_name)
+
+
+def post_page(context: Context, queryset: QuerySet,
+              args: Dict[str, object]) -> List[Post]:
+    """Страница постов от курсора before, загруженные посты кешируются."""
+    paginator = CursorPaginator(queryset, first(args),
+                                before=string_arg(args, 'before'))
+    posts = list(paginator.page())
+    context.loader('posts', by_pk(Post)).prime(posts)
+    return posts
+
+
+def first_children(model, parent: str, ordering: Iterable[str]) -> Resolver:
+    """Первые first дочерних объектов каждого родителя одним запросом."""
+    ordering = list(ordering)
+
+    def resolve(context, objects, args):
+        limit = first(args)
+
+        def batch(keys):
+            top = model.objects.filter(
+                **{parent: OuterRef(parent)}
+            ).order_by(*ordering).values('id')[:limit]
+            children = defaultdict(list)
+            for child in model.objects.filter(
+                    **{f'{parent}__in': keys}, id__in=Subquery(top)
+            ).order_by(*ordering):
+                children[getattr(child, f'{parent}_id')].append(child)
+            return children
+
+        loader = context.loader((model, parent, limit), batch)
+        return [children or []
+                for children in loader.load_many([o.pk for o in objects])]
+
+    return Resolver(resolve, model.__name__, many=True)
+
+
+def comment_counts(context, objects, args):
+    def batch(keys):
+        return dict(Comment.objects.filter(post__in=keys).values_list(
+            'post').annotate(count=Count('id')))
+
+    counts = context.loader('comment_counts', batch).load_many(
+        [post.pk for post in objects])
+    return [count or 0 for count in counts]
+
+
+def counter(name: str) -> Resolver:
+    """Поле счетчиков пользователя.
+
+    Запрос к графу только читает базу: недостающие счетчики считаются
+    заново, но не сохраняются.
+    """
+
+    def batch(keys):
+        found = UserCounters.objects.in_bulk(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            found.update(counted(missing))
+        return found
+
+    def resolve(context, objects, args):
+        counters = context.loader('counters', batch).load_many(
+            [user.pk for user in objects])
+        return [0 if user_counters is None else getattr(user_counters, name)
+                for user_counters in counters]
+
+    return Resolver(resolve)
+
+
+def following(context, objects, args):
+    if not context.user.is_authenticated:
+        return [False] * len(objects)
+
+    def batch(keys):
+        authors = Follow.objects.filter(
+            user=context.user, author__in=keys
+        ).values_list('author_id', flat=True)
+        return {author: True for author in authors}
+
+    followed = context.loader('following', batch).load_many(
+        [user.pk for user in objects])
+    return [bool(value) for value in followed]
+
+
+def root_posts(context, objects, args):
+    queryset = Post.objects.all()
+    group = string_arg(args, 'group')
+    if group is not None:
+        queryset = queryset.filter(group__slug=group)
+    author = string_arg(args, 'author')
+    if author is not None:
+        queryset = queryset.filter(author__username=author)
+    return [post_page(context, queryset, args)]
+
+
+def root_feed(context, objects, args):
+    if not context.user.is_authenticated:
+        raise QueryError('Для ленты подписок нужно войти.')
+    return [post_page(context, timeline_posts(context.user), args)]
+
+
+def root_post(context, objects, args):
+    post_id = args.get('id')
+    if (not isinstance(post_id, int) or isinstance(post_id, bool)
+            or not 0 < post_id <= MAX_ID):
+        raise QueryError('id должен быть положительным числом.')
+    return load_posts(context, [post_id])
+
+
+def root_lookup(model, field: str) -> Resolver:
+    """Объект по уникальному строковому полю."""
+
+    def resolve(context, objects, args):
+        value = string_arg(args, field)
+        if value is None:
+            raise QueryError(f'Нужен аргумент {field}.')
+        return [model.objects.filter(**{field: value}).first()]
+
+    return Resolver(resolve, model.__name__)
+
+
+SCHEMA: Dict[str, Dict[str, Resolver]] = {
+    'Query': {
+        'posts': Resolver(root_posts, 'Post', many=True),
+        'feed': Resolver(root_feed, 'Post', many=True),
+        'post': Resolver(root_post, 'Post'),
+        'group': root_lookup(Group, 'slug'),
+        'user': root_lookup(User, 'username'),
+    },
+    'Post': {
+        'id': attr('id'),
+        'text': attr('text'),
+        'pub_date': attr('pub_date'),
+        'cursor': Resolver(lambda context, objects, args: [
+            encode_cursor(post) for post in objects]),
+        'image': Resolver(lambda context, objects, args: [
+            post.image.url if post.image else None for post in objects]),
+        'author': related('author_id', 'User', load_users),
+        'group': related('group_id', 'Group', load_groups),
+        'comment_count': Resolver(comment_counts),
+        'comments': first_children(Comment, 'post', ['pub_date', 'id']),
+    },
+    'Comment': {
+        'id': attr('id'),
+        'text': attr('text'),
+        'pub_date': attr('pub_date'),
+        'author': related('author_id', 'User', load_users),
+        'post': related('post_id', 'Post', load_posts),
+    },
+    'Group': {
+        'id': attr('id'),
+        'slug': attr('slug'),
+        'title': attr('title'),
+        'description': attr('description'),
+        'posts': first_children(Post, 'group', ['-pub_date', '-id']),
+    },
+    'User': {
+        'id': attr('id'),
+        'username': attr('username'),
+        'full_name': Resolver(lambda context, objects, args: [
+            user.get_full_name() for user in objects]),
+        'post_count': counter('post_count'),
+        'follower_count': counter('follower_count'),
+        'following_count': counter('following_count'),
+        'following': Resolver(following),
+        'posts': first_children(Post, 'author', ['-pub_date', '-id']),
+    },
+}
+
+
+def check(fields: List[Field], type_name: str,
+          multiplier: int = 1) -> int:
+    """Проверяет поля по схеме, возвращает стоимость запроса.
+
+    Стоимость - число значений в худшем случае: поле списка умножает
+    стоимость вложенных полей на свой first. Глубину ограничивает Parser.
+    """
+    cost = 0
+    for field in fields:
+        resolver = SCHEMA[type_name].get(field.name)
+        if resolver is None:
+            raise QueryError(f'У типа {type_name} нет поля {field.name}.')
+        cost += multiplier
+        if resolver.type is None:
+            if field.selections:
+                raise QueryError(f'У поля {field.name} нет вложенных полей.')
+            continue
+        if not field.selections:
+            raise QueryError(f'Для поля {field.name} нужно выбрать поля.')
+        inner = multiplier * (first(field.args) if resolver.many else 1)
+        cost += check(field.selections, resolver.type, inner)
+    return cost
+
+
+def execute(context: Context, fields: List[Field], type_name: str,
+            objects: List) -> List[dict]:
+    """Значения полей для всех объектов одного уровня."""
+    results = [{} for _ in objects]
+    for field in fields:
+        resolver = SCHEMA[type_name][field.name]
+        values = resolver.resolve(context, objects, field.args)
+        if resolver.type is not None and resolver.many:
+            rendered = iter(execute(
+                context, field.selections, resolver.type,
+                [child for children in values for child in children]))
+            values = [[next(rendered) for _ in children]
+                      for children in values]
+        elif resolver.type is not None:
+            rendered = iter(execute(
+                context, field.selections, resolver.type,
+                [value for value in values if value is not None]))
+            values = [None if value is None else next(rendered)
+                      for value in values]
+        for result, value in zip(results, values):
+            result[field.name] = value
+    return results
+
+
+def run(text: str, user) -> dict:
+    """Выполняет запрос от имени user и возвращает данные ответа."""
+    if not text or not text.strip():
+        raise QueryError('Пустой запрос.')
+    fields = Parser(text).document()
+    cost = check(fields, 'Query')
+    if cost > settings.API_QUERY_MAX_COST:
+        raise QueryError(f'Стоимость запроса {cost} больше '
+                         f'{settings.API_QUERY_MAX_COST}.')
+    return execute(Context(user), fields, 'Query', [None])[0]
@@ -0,0 +1,89 @@
+"""Сериализация постов и комментариев для API.
+
+Строки выбираются через values() одним запросом вместе с полями
+авторов и групп и превращаются в словари без создания моделей и без
+шаблонов. Набор полей поста задается параметром ?fields=.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from django.core.files.storage import default_storage
+from django.db.models import QuerySet
+
+# Поле ответа -> столбцы values(), нужные для него.
+POST_FIELDS: Dict[str, List[str]] = {
+    'id': ['id'],
+    'text': ['text'],
+    'pub_date': ['pub_date'],
+    'image': ['image'],
+    'author': ['author_id', 'author__username', 'author__first_name',
+               'author__last_name'],
+    'group': ['group_id', 'group__slug', 'group__title'],
+}
+
+COMMENT_COLUMNS = ['id', 'text', 'pub_date', 'author_id', 'author__username',
+                   'author__first_name', 'author__last_name']
+
+
+class FieldsError(ValueError):
+    """В ?fields= есть неизвестные поля."""
+
+
+def parse_fields(raw: Optional[str]) -> List[str]:
+    """Поля поста из параметра ?fields=; без него - все поля."""
+    if not raw:
+        return list(POST_FIELDS)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown:
+        raise FieldsError(f'Неизвестные поля: {", ".join(unknown)}. '
+                          f'Доступны: {", ".join(POST_FIELDS)}.')
+    return fields
+
+
+def post_values(queryset: QuerySet, fields: Iterable[str]) -> QuerySet:
+    """values() со столбцами для полей; id и pub_date нужны курсору."""
+    columns = ['id', 'pub_date']
+    for field in fields:
+        columns += [column for column in POST_FIELDS[field]
+                    if column not in columns]
+    return queryset.values(*columns)
+
+
+def serialize_author(row: dict) -> dict:
+    return {
+        'id': row['author_id'],
+        'username': row['author__username'],
+        'full_name': f'{row["author__first_name"]} '
+                     f'{row["author__last_name"]}'.strip(),
+    }
+
+
+def serialize_post(row: dict, fields: Iterable[str]) -> dict:
+    """Словарь поста из строки post_values()."""
+    data = {}
+    for field in fields:
+        if field == 'author':
+            data['author'] = serialize_author(row)
+        elif field == 'group':
+            data['group'] = None if row['group_id'] is None else {
+                'id': row['group_id'],
+                'slug': row['group__slug'],
+                'title': row['group__title'],
+            }
+        elif field == 'image':
+            data['image'] = (default_storage.url(row['image'])
+                             if row['image'] else None)
+        else:
+            data[field] = row[field]
+    return data
+
+
+def serialize_comment(row: dict) -> dict:
+    """Словарь комментария из строки values(*COMMENT_COLUMNS)."""
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'],
+        'author': serialize_author(row),
+    }
@@ -0,0 +1,274 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, UserCounters
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Author', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост {number}')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data),
+                                content_type='application/json')
+
+    def test_feed_embeds_authors_and_groups(self):
+        """Лента отдает посты с авторами и группами."""
+        response = self.client.get(reverse('api:posts'))
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results'][0]
+        self.assertEqual(first['id'], self.posts[-1].id)
+        self.assertEqual(first['text'], 'Пост 2')
+        self.assertEqual(first['author'], {
+            'id': self.author.id,
+            'username': 'Author',
+            'full_name': 'Лев Толстой',
+        })
+        self.assertEqual(first['group']['slug'], 'test-slug')
+        self.assertIsNone(first['image'])
+
+    def test_post_detail(self):
+        """Пост отдается по id, несуществующий - с ошибкой 404."""
+        response = self.client.get(
+            reverse('api:post_detail', args=[self.posts[0].id]))
+        self.assertEqual(response.json()['text'], 'Пост 0')
+        response = self.client.get(reverse('api:post_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_sparse_fieldsets(self):
+        """?fields= оставляет в постах только нужные поля."""
+        response = self.client.get(reverse('api:posts'),
+                                   {'fields': 'id,author'})
+        self.assertEqual(set(response.json()['results'][0]),
+                         {'id', 'author'})
+        response = self.client.get(reverse('api:posts'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_cursor_pagination(self):
+        """Курсор next открывает следующую страницу."""
+        url = reverse('api:posts')
+        first = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(
+            url, {'limit': 2, 'before': first['next']}).json()
+        self.assertEqual([post['id'] for post in second['results']],
+                         [self.posts[0].id])
+        self.assertIsNone(second['next'])
+
+    def test_group_and_user_feeds(self):
+        """Ленты сообщества и автора отдают их описание."""
+        response = self.client.get(
+            reverse('api:group_posts', args=['test-slug'])).json()
+        self.assertEqual(response['group']['title'], 'Тестовый заголовок')
+        self.assertEqual(len(response['results']), 3)
+        response = self.client.get(
+            reverse('api:user_posts', args=['Author'])).json()
+        self.assertEqual(response['author']['post_count'], 3)
+        self.assertFalse(response['author']['following'])
+        response = self.client.get(
+            reverse('api:user_posts', args=['Nobody']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_create_post(self):
+        """POST создает пост от имени пользователя."""
+        response = self.post_json(reverse('api:posts'),
+                                  {'text': 'Из приложения',
+                                   'group': self.group.id})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(text='Из приложения')
+        self.assertEqual(post.author, self.reader)
+        self.assertEqual(response.json()['group']['id'], self.group.id)
+        response = self.post_json(reverse('api:posts'), {'text': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['fields'])
+
+    def test_writes_require_login(self):
+        """Запись без входа отклоняется со статусом 401."""
+        self.client.logout()
+        response = self.post_json(reverse('api:posts'), {'text': 'Аноним'})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(reverse('api:follow_feed'))
+        self.assertEqual(response.status_code, 401)
+        response = self.client.put(reverse('api:posts'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_comments(self):
+        """Комментарии добавляются и читаются от старых к новым."""
+        post = self.posts[0]
+        url = reverse('api:comments', args=[post.id])
+        Comment.objects.create(post=post, author=self.author, text='Первый')
+        response = self.post_json(url, {'text': 'Второй'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['author']['username'], 'Reader')
+        texts = [comment['text']
+                 for comment in self.client.get(url).json()['results']]
+        self.assertEqual(texts, ['Первый', 'Второй'])
+
+    def test_follow(self):
+        """Подписка меняет ленту подписок, отписка - удаляет подписку."""
+        url = reverse('api:follow', args=['Author'])
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        response = self.client.get(reverse('api:follow_feed')).json()
+        self.assertEqual(len(response['results']), 3)
+        self.assertEqual(self.client.delete(url).json(),
+                         {'following': False})
+        self.assertFalse(Follow.objects.filter(user=self.reader).exists())
+
+    @override_settings(API_MAX_LIMIT=2)
+    def test_limit_is_capped(self):
+        """limit не превышает API_MAX_LIMIT."""
+        response = self.client.get(reverse('api:posts'), {'limit': 50})
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class GraphQueryTests(TestCase):
+
+    QUERY = '''
+        query Feed {
+          posts(first: %d) {
+            id text cursor
+            author { username post_count following }
+            group { slug }
+            comment_count
+            comments(first: 2) { text author { username } }
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        groups = [Group.objects.create(title=f'Группа {number}',
+                                       slug=f'group-{number}',
+                                       description='Описание')
+                  for number in range(3)]
+        authors = [User.objects.create_user(username=f'Author{number}')
+                   for number in range(5)]
+        Follow.objects.create(user=cls.reader, author=authors[0])
+        for number in range(50):
+            post = Post.objects.create(
+                author=authors[number % 5], group=groups[number % 3],
+                text=f'Пост {number}')
+            for comment in range(3):
+                Comment.objects.create(post=post, author=authors[comment],
+                                       text=f'Комментарий {comment}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def query(self, text):
+        return self.client.post(reverse('api:query'),
+                                json.dumps({'query': text}),
+                                content_type='application/json')
+
+    def test_nested_query(self):
+        """Запрос возвращает посты со связанными объектами."""
+        response = self.query(self.QUERY % 5)
+        self.assertEqual(response.status_code, 200)
+        posts = response.json()['data']['posts']
+        self.assertEqual(len(posts), 5)
+        self.assertEqual(posts[0]['text'], 'Пост 49')
+        self.assertEqual(posts[0]['author'],
+                         {'username': 'Author4', 'post_count': 10,
+                          'following': False})
+        self.assertEqual(posts[0]['group'], {'slug': 'group-1'})
+        self.assertEqual(posts[0]['comment_count'], 3)
+        self.assertEqual(posts[0]['comments'], [
+            {'text': 'Комментарий 0', 'author': {'username': 'Author0'}},
+            {'text': 'Комментарий 1', 'author': {'username': 'Author1'}},
+        ])
+        response = self.client.get(reverse('api:query'), {
+            'query': '{ posts(first: 1, before: "%s") { text } }'
+                     % posts[0]['cursor']})
+        self.assertEqual(response.json()['data']['posts'],
+                         [{'text': 'Пост 48'}])
+
+    def test_queries_do_not_grow_with_posts(self):
+        """Число SQL-запросов не зависит от числа постов."""
+        counts = []
+        for size in (5, 50):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.query(self.QUERY % size)
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_lookups(self):
+        """Пользователь и сообщество ищутся по имени и адресу."""
+        response = self.query('''{
+            user(username: "Author0") { following posts(first: 1) { id } }
+            group(slug: "missing") { title }
+        }''')
+        data = response.json()['data']
+        self.assertTrue(data['user']['following'])
+        self.assertEqual(len(data['user']['posts']), 1)
+        self.assertIsNone(data['group'])
+
+    def test_invalid_queries(self):
+        """Ошибки синтаксиса, схемы и лимитов отдаются со статусом 400."""
+        queries = {
+            '{ posts { id ': 'конец запроса',
+            '{ posts { password } }': 'password',
+            '{ posts }': 'нужно выбрать поля',
+            '{ posts(first: "x") { id } }': 'first',
+            '{ post(id: true) { id } }': 'id',
+            '{ post(id: 99999999999999999999) { id } }': 'id',
+            '{ post(id: 1) { author { posts { author { posts { id } } } } } }':
+                'Глубина',
+            '{ posts(first: 100) { comments(first: 100) { id } } }':
+                'Стоимость',
+            '{ post(id: 1) ' + '{ author { posts ' * 2000: 'Глубина',
+        }
+        for text, message in queries.items():
+            with self.subTest(query=text):
+                response = self.query(text)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()['error'])
+
+    def test_counters_are_read_only(self):
+        """Недостающие счетчики считаются, но не сохраняются."""
+        UserCounters.objects.filter(user__username='Author0').delete()
+        response = self.query('{ user(username: "Author0") { post_count } }')
+        self.assertEqual(response.json()['data']['user'],
+                         {'post_count': 10})
+        self.assertFalse(UserCounters.objects.filter(
+            user__username='Author0').exists())
+
+    def test_feed_requires_login(self):
+        """Лента подписок доступна только после входа."""
+        self.client.logout()
+        response = self.query('{ feed { id } }')
+        self.assertEqual(response.status_code, 400)
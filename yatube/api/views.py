@@ -0,0 +1,258 @@
+"""JSON API лент, постов, комментариев и подписок.
+
+Повторяет страницы приложения posts без рендера шаблонов. Ленты
+листаются курсорами ?before=/?after= (ответ содержит next и previous),
+размер страницы - ?limit= до API_MAX_LIMIT, поля постов -
+?fields=id,text,author. Запись принимает JSON или данные формы;
+аутентификация - сессия сайта.
+"""
+
+import json
+from functools import wraps
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.http import Http404, HttpRequest, JsonResponse, QueryDict
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+
+from api.graph import QueryError, run
+from api.serializers import (COMMENT_COLUMNS, FieldsError, parse_fields,
+                             post_values, serialize_comment, serialize_post)
+from core.db.replicas import use_replica
+from posts.counters import get_counters
+from posts.forms import CommentForm, PostForm
+from posts.models import Follow, Group, Post
+from posts.paginators import CursorPaginator
+from posts.thumbnails import queue_thumbnail
+from posts.timeline import timeline_posts
+from users.lookup import get_user_or_404
+
+
+class ApiError(Exception):
+    """Ошибка, которую API отдает клиенту со статусом status."""
+
+    def __init__(self, status: int, message: str, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def json_response(data: dict, status: int = 200) -> JsonResponse:
+    return JsonResponse(data, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(methods: Iterable[str], login: Iterable[str] = ()) -> Callable:
+    """Декоратор view API.
+
+    methods - допустимые методы, login - методы, требующие входа.
+    GET читает из реплики. View возвращает словарь или пару
+    (словарь, статус); ApiError и Http404 становятся JSON-ошибками.
+    """
+    methods, login = set(methods), set(login)
+
+    def decorator(view: Callable) -> Callable:
+        read_view = use_replica(view)
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> JsonResponse:
+            try:
+                if request.method not in methods:
+                    raise ApiError(405, 'Метод не поддерживается.')
+                if (request.method in login
+                        and not request.user.is_authenticated):
+                    raise ApiError(401, 'Нужно войти.')
+                handler = read_view if request.method == 'GET' else view
+                result = handler(request, *args, **kwargs)
+            except Http404:
+                return json_response({'error': 'Не найдено.'}, 404)
+            except ApiError as error:
+                response = json_response(
+                    {'error': str(error), **error.extra}, error.status)
+                if error.status == 405:
+                    response['Allow'] = ', '.join(sorted(methods))
+                return response
+            if isinstance(result, tuple):
+                return json_response(*result)
+            return json_response(result)
+
+        return wrapper
+
+    return decorator
+
+
+def request_data(request: HttpRequest) -> QueryDict:
+    """Данные записи из JSON-тела или формы."""
+    if request.content_type != 'application/json':
+        return request.POST
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError(400, 'Тело запроса - не JSON.')
+    if not isinstance(payload, dict):
+        raise ApiError(400, 'Тело запроса должно быть объектом.')
+    data = QueryDict(mutable=True)
+    for key, value in payload.items():
+        data[key] = '' if value is None else str(value)
+    return data
+
+
+def validated(form):
+    """Проверяет форму; ошибки полей уходят клиенту со статусом 400."""
+    if not form.is_valid():
+        raise ApiError(400, 'Ошибка в данных.', fields={
+            field: [str(message) for message in messages]
+            for field, messages in form.errors.items()
+        })
+    return form
+
+
+def page_size(request: HttpRequest, default: int) -> int:
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise ApiError(400, 'limit должен быть числом.')
+    return min(max(limit, 1), settings.API_MAX_LIMIT)
+
+
+def post_fields(request: HttpRequest):
+    try:
+        return parse_fields(request.GET.get('fields'))
+    except FieldsError as error:
+        raise ApiError(400, str(error))
+
+
+def post_page(request: HttpRequest, queryset: QuerySet, **extra) -> dict:
+    """Страница ленты: посты с авторами и группами одним запросом."""
+    fields = post_fields(request)
+    paginator = CursorPaginator(
+        post_values(queryset, fields),
+        page_size(request, settings.POSTS_PER_PAGE),
+        before=request.GET.get('before'), after=request.GET.get('after'))
+    page = paginator.page()
+    return {
+        **extra,
+        'results': [serialize_post(row, fields) for row in page],
+        'next': page.next_cursor(),
+        'previous': page.previous_cursor(),
+    }
+
+
+def post_data(request: HttpRequest, post_id: int) -> dict:
+    fields = post_fields(request)
+    row = get_object_or_404(post_values(Post.objects.all(), fields),
+                            id=post_id)
+    return serialize_post(row, fields)
+
+
+@api_view(['GET', 'POST'], login=['POST'])
+def posts(request: HttpRequest):
+    """Главная лента; POST создает пост."""
+    if request.method == 'GET':
+        return post_page(request, Post.objects.all())
+    form = validated(PostForm(request_data(request),
+                              files=request.FILES or None))
+    post = form.save(commit=False)
+    post.author = request.user
+    post.save()
+    if post.image:
+        queue_thumbnail(post.image.name)
+    return post_data(request, post.id), 201
+
+
+@api_view(['GET'])
+def post_detail(request: HttpRequest, post_id: int) -> dict:
+    """Один пост."""
+    return post_data(request, post_id)
+
+
+@api_view(['GET', 'POST'], login=['POST'])
+def comments(request: HttpRequest, post_id: int):
+    """Комментарии поста от старых к новым; POST добавляет комментарий."""
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    if request.method == 'POST':
+        comment = validated(CommentForm(request_data(request))).save(
+            commit=False)
+        comment.author = request.user
+        comment.post = post
+        comment.save()
+        row = post.comments.values(*COMMENT_COLUMNS).get(id=comment.id)
+        return serialize_comment(row), 201
+    paginator = CursorPaginator(
+        post.comments.values(*COMMENT_COLUMNS),
+        page_size(request, settings.COMMENTS_PER_PAGE),
+        before=request.GET.get('before'), after=request.GET.get('after'),
+        newest_first=False)
+    page = paginator.page()
+    return {
+        'results': [serialize_comment(row) for row in page],
+        'next': page.next_cursor(),
+        'previous': page.previous_cursor(),
+    }
+
+
+@api_view(['GET'])
+def group_posts(request: HttpRequest, slug: str) -> dict:
+    """Лента сообщества."""
+    group = get_object_or_404(Group, slug=slug)
+    return post_page(request, group.posts.all(), group={
+        'id': group.id,
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+    })
+
+
+@api_view(['GET'])
+def user_posts(request: HttpRequest, username: str) -> dict:
+    """Лента автора со счетчиками и признаком подписки."""
+    author = get_user_or_404(username)
+    counters = get_counters(author)
+    following = (request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=author).exists())
+    return post_page(request, author.posts.all(), author={
+        'id': author.id,
+        'username': author.username,
+        'full_name': author.get_full_name(),
+        'post_count': counters.post_count,
+        'follower_count': counters.follower_count,
+        'following_count': counters.following_count,
+        'following': following,
+    })
+
+
+@api_view(['GET'], login=['GET'])
+def follow_feed(request: HttpRequest) -> dict:
+    """Лента подписок пользователя."""
+    return post_page(request, timeline_posts(request.user))
+
+
+@api_view(['POST', 'DELETE'], login=['POST', 'DELETE'])
+def follow(request: HttpRequest, username: str):
+    """POST подписывает на автора, DELETE отписывает."""
+    author = get_user_or_404(username)
+    if request.method == 'DELETE':
+        Follow.objects.filter(user=request.user, author=author).delete()
+        return {'following': False}
+    if author == request.user:
+        raise ApiError(400, 'Нельзя подписаться на себя.')
+    _, created = Follow.objects.get_or_create(user=request.user,
+                                              author=author)
+    return {'following': True}, 201 if created else 200
+
+
+# Запросы только читают данные, поэтому POST не требует CSRF-токена.
+@csrf_exempt
+@api_view(['GET', 'POST'])
+def query(request: HttpRequest) -> dict:
+    """Запрос к графу постов, см. api.graph."""
+    if request.method == 'GET':
+        text = request.GET.get('query', '')
+    else:
+        text = request_data(request).get('query', '')
+    try:
+        return {'data': run(text, request.user)}
+    except QueryError as error:
+        raise ApiError(400, str(error))
@@ -0,0 +1,347 @@
+"""Двухуровневый кеш.
+
+Перед общим для всех процессов кешем (файловым или Redis) стоит
+маленький LRU-кеш внутри процесса. Значения из общего кеша живут в
+локальном не дольше LOCAL_TIMEOUT секунд, поэтому удаление ключа в
+одном процессе доходит до остальных не позже этого срока, а в самом
+процессе - сразу.
+
+Настройки в OPTIONS: LOCAL и SHARED - алиасы кешей-уровней из
+CACHES, LOCAL_TIMEOUT, LOCK_TIMEOUT - сколько держится блокировка
+get_or_set от одновременного пересчета одного значения.
+
+Блокировки (здесь и в get_or_refresh) берутся через add общего кеша.
+В Redis add атомарен, а у файлового кеша это проверка и запись
+отдельными шагами, поэтому несколько процессов изредка пересчитывают
+одно значение одновременно. Результат от этого не меняется, теряется
+только экономия; где она важна, общим кешем должен быть Redis.
+
+get_or_refresh работает с любым кешем и защищает от одновременного
+пересчета значения с истекающим сроком: значение пересчитывается чуть
+раньше срока с вероятностью, растущей к его концу, пересчитывает его
+один запрос, а остальные тем временем отдают старую копию - в том
+числе копию прошлой версии, если версия входит в ключ. refresh_chunks
+делает то же для значения, которое при пересчете отдается по частям.
+
+isolated_caches подменяет все кеши временными на время тестов и
+замеров, чтобы их очистка не задевала кеш работающего сайта.
+"""
+
+import copy
+import math
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from typing import (Callable, Dict, Iterable, Iterator, List, Optional,
+                    Tuple)
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_missing = object()
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_stats_lock = Lock()
+_isolated: List[str] = []
+
+
+class TieredCache(BaseCache):
+    """Локальный LRU-кеш перед общим кешем."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._local_alias = options.get('LOCAL', 'local')
+        self._shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+
+    @property
+    def local(self) -> BaseCache:
+        return caches[self._local_alias]
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    def _count(self, tier: str, event: str, number: int = 1) -> None:
+        with _stats_lock:
+            _stats[tier][event] += number
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Попадания и промахи уровней в этом процессе."""
+        with _stats_lock:
+            return {tier: dict(events) for tier, events in _stats.items()}
+
+    def _local_timeout(self, timeout) -> int:
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.local_timeout
+        return max(min(timeout - time.time(), self.local_timeout), 0)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        added = self.shared.add(key, value, timeout)
+        if added:
+            self.local.set(key, value, self._local_timeout(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            self._count('local', 'hits')
+            return value
+        self._count('local', 'misses')
+        value = self.shared.get(key, _missing)
+        if value is _missing:
+            self._count('shared', 'misses')
+            return default
+        self._count('shared', 'hits')
+        self.local.set(key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, self._local_timeout(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.local.delete(key)
+        return self.shared.touch(key, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        found = self.local.get_many(made)
+        self._count('local', 'hits', len(found))
+        self._count('local', 'misses', len(made) - len(found))
+        missing = [key for key in made if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing)
+            self._count('shared', 'hits', len(shared))
+            self._count('shared', 'misses', len(missing) - len(shared))
+            if shared:
+                self.local.set_many(shared, self.local_timeout)
+            found.update(shared)
+        return {made[key]: value for key, value in found.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_key(key, version=version): key for key in data}
+        values = {key: data[original] for key, original in made.items()}
+        failed = self.shared.set_many(values, timeout) or []
+        self.local.set_many(values, self._local_timeout(timeout))
+        return [made[key] for key in failed]
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        self.local.delete_many(made)
+        self.shared.delete_many(made)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        return self.local.has_key(key) or self.shared.has_key(key)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.local.delete(key)
+        return self.shared.incr(key, delta)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        """get_or_set, в котором значение считает только один процесс.
+
+        Первый промахнувшийся берет блокировку в общем кеше и считает
+        значение, остальные ждут его до LOCK_TIMEOUT секунд.
+        """
+        value = self.get(key, _missing, version=version)
+        if value is not _missing:
+            return value
+        lock_key = self.make_key(f'{key}:lock', version=version)
+        if not self.shared.add(lock_key, 1, self.lock_timeout):
+            self._count('shared', 'lock_waits')
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.get(key, _missing, version=version)
+                if value is not _missing:
+                    return value
+        try:
+            value = default() if callable(default) else default
+            self.set(key, value, timeout, version=version)
+        finally:
+            self.shared.delete(lock_key)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.local.close(**kwargs)
+        self.shared.close(**kwargs)
+
+
+def _wait_for(cache: BaseCache, key: str, compute: Callable[[], object],
+              wait: float) -> object:
+    """Ждет значение, которое считает другой запрос, или считает само."""
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def _cached_or_lock(cache: BaseCache, key: str, lock_key: str, beta: float,
+                    lock_timeout: int) -> Tuple[object, bool]:
+    """Значение, которое можно отдать, и взята ли блокировка пересчета.
+
+    Пока значение свежо или его пересчитывает другой запрос, отдается
+    оно; иначе вместо значения _missing.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        early = delta * beta * math.log(1 - random.random())
+        if time.time() - early < expires:
+            return value, False
+        if not cache.add(lock_key, 1, lock_timeout):
+            return value, False
+        return _missing, True
+    return _missing, cache.add(lock_key, 1, lock_timeout)
+
+
+def refresh_chunks(cache: BaseCache, key: str, timeout: Optional[int],
+                   compute: Callable[[], Iterable],
+                   join: Callable[[List], object], stale: int = 60,
+                   beta: float = 1.0, wait: float = 2.0,
+                   lock_timeout: int = 10,
+                   latest_key: Optional[str] = None,
+                   read_only: bool = False) -> Iterator:
+    """get_or_refresh для значения, которое считается по частям.
+
+    compute возвращает части значения, join собирает из них значение
+    для кеша. Найденное в кеше значение отдается целиком, а при
+    пересчете части отдаются по мере расчета, так что потоковый ответ
+    не ждет конца расчета. Блокировка пересчета снимается и при
+    незавершенном обходе (клиент отключился).
+    """
+    lock_key = f'{key}:lock'
+    if read_only:
+        entry = cache.get(key)
+        if entry is None:
+            yield from compute()
+        else:
+            yield entry[0]
+        return
+    value, locked = _cached_or_lock(cache, key, lock_key, beta, lock_timeout)
+    if value is not _missing:
+        yield value
+        return
+    if not locked:
+        latest = None if latest_key is None else cache.get(latest_key)
+        if latest is not None:
+            yield latest[0]
+        else:
+            yield _wait_for(cache, key, lambda: join(list(compute())), wait)
+        return
+    try:
+        started = time.time()
+        parts = []
+        for part in compute():
+            parts.append(part)
+            yield part
+        value = join(parts)
+        delta = time.time() - started
+        if timeout is None:
+            entry, ttl = (value, math.inf, delta), None
+        else:
+            entry = (value, started + delta + timeout, delta)
+            ttl = timeout + stale
+        cache.set(key, entry, ttl)
+        if latest_key is not None:
+            cache.set(latest_key, entry, ttl)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_or_refresh(cache: BaseCache, key: str, timeout: Optional[int],
+                   compute: Callable[[], object], stale: int = 60,
+                   beta: float = 1.0, wait: float = 2.0,
+                   lock_timeout: int = 10,
+                   latest_key: Optional[str] = None,
+                   read_only: bool = False) -> object:
+    """Значение из кеша с ранним пересчетом и одним пересчетчиком.
+
+    Вместе со значением хранятся срок его свежести и время расчета,
+    а сама запись живет на stale секунд дольше срока. Чем ближе срок и
+    дольше расчет, тем вероятнее досрочный пересчет (beta усиливает
+    эффект). Пересчитывает запрос, взявший блокировку, остальные отдают
+    старое значение, а если его нет - ждут новое до wait секунд.
+
+    latest_key - ключ последней копии значения для ключей с версией:
+    после смены версии старой записи под новым ключом нет, и пока один
+    запрос считает новую, остальные отдают копию прошлой версии.
+
+    read_only - только читать кеш: при промахе значение считается, но
+    не сохраняется (например, если оно построено по отстающей реплике).
+    """
+    [value] = refresh_chunks(
+        cache, key, timeout, lambda: [compute()], lambda parts: parts[0],
+        stale=stale, beta=beta, wait=wait, lock_timeout=lock_timeout,
+        latest_key=latest_key, read_only=read_only)
+    return value
+
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+FILE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+
+
+@contextmanager
+def isolated_caches() -> Iterator[None]:
+    """Подменяет кеши из CACHES временными.
+
+    Кеши в памяти получают свое пространство, а общие (файловый,
+    Redis) - временный каталог, который удаляется после выхода.
+    TieredCache остается как есть и собирается из подмененных уровней.
+    """
+    from django.test.utils import override_settings
+
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    config = copy.deepcopy(settings.CACHES)
+    for alias, params in config.items():
+        if params['BACKEND'] == LOCMEM_BACKEND:
+            params['LOCATION'] = f'{directory}:{alias}'
+        elif params['BACKEND'] != TieredCache.__module__ + '.TieredCache':
+            config[alias] = {
+                'BACKEND': FILE_BACKEND,
+                'LOCATION': f'{directory}/{alias}',
+                'OPTIONS': params.get('OPTIONS', {}),
+            }
+    _isolated.append(directory)
+    try:
+        with override_settings(CACHES=config):
+            yield
+    finally:
+        _isolated.remove(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def caches_isolated() -> bool:
+    """Подменены ли сейчас кеши временными через isolated_caches."""
+    return bool(_isolated)
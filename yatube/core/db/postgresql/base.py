@@ -0,0 +1,92 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+Соединения берутся из psycopg2.pool.ThreadedConnectionPool и при
+закрытии возвращаются в пул, а не рвутся. Перед выдачей соединение
+проверяется запросом SELECT 1, сломанные соединения выбрасываются.
+Размер пула задается в OPTIONS: pool_min_size и pool_max_size;
+свободных соединений пул держит не больше pool_min_size. Когда
+все соединения заняты, поток ждет освобождения до pool_timeout секунд,
+а затем получает OperationalError.
+"""
+
+import threading
+import time
+from typing import Dict
+
+from django.db.backends.postgresql import base
+from django.db.utils import OperationalError
+from psycopg2 import Error as DatabaseError
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+POOL_RETRY_INTERVAL = 0.05
+
+_pools: Dict[tuple, ThreadedConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def is_healthy(connection) -> bool:
+    """Соединение открыто и отвечает на запросы."""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except DatabaseError:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pool_min_size = params.pop('pool_min_size', 1)
+        self.pool_max_size = params.pop('pool_max_size', 10)
+        self.pool_timeout = params.pop('pool_timeout', 5)
+        return params
+
+    def get_pool(self, conn_params) -> ThreadedConnectionPool:
+        """Пул для параметров подключения (база меняется в тестах)."""
+        key = tuple(sorted(conn_params.items()))
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ThreadedConnectionPool(
+                    self.pool_min_size, self.pool_max_size, **conn_params)
+            return _pools[key]
+
+    def checkout(self, pool: ThreadedConnectionPool):
+        """Берет соединение из пула, ожидая свободное до pool_timeout."""
+        deadline = time.monotonic() + self.pool_timeout
+        while True:
+            try:
+                return pool.getconn()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise OperationalError(
+                        f'Все {self.pool_max_size} соединений пула заняты '
+                        f'дольше {self.pool_timeout} с')
+                time.sleep(POOL_RETRY_INTERVAL)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool = self.get_pool(conn_params)
+        for _ in range(self.pool_max_size):
+            connection = self.checkout(pool)
+            if is_healthy(connection):
+                break
+            pool.putconn(connection, close=True)
+        else:
+            connection = self.checkout(pool)
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection,
+                              close=bool(self.connection.closed))
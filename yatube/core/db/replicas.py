@@ -0,0 +1,102 @@
+"""Чтение с реплик базы данных.
+
+Views с декоратором use_replica читают из случайной реплики из
+settings.DATABASE_REPLICAS, все остальные чтения и все записи идут в
+основную базу. После любой записи ReplicaMiddleware ставит cookie, и
+пока она жива (REPLICA_STICKY_SECONDS), пользователь читает из
+основной базы и сразу видит свои изменения, даже если реплика отстает.
+Внутри самого view после первой записи чтения тоже идут в основную
+базу. Потоковый ответ рендерится после выхода из view, и на время
+рендера каждой его порции реплика выбирается снова.
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+
+from core.streaming import stream_within
+
+STICKY_COOKIE = 'db_primary'
+
+_state = threading.local()
+
+
+def current_replica() -> Optional[str]:
+    """Алиас реплики для чтений текущего запроса или None."""
+    return getattr(_state, 'replica', None)
+
+
+class ReplicaRouter:
+    """Направляет чтения в реплику, выбранную use_replica."""
+
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        _state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+@contextmanager
+def reading_from(replica: str) -> Iterator[None]:
+    """Направляет чтения внутри блока в реплику replica."""
+    _state.replica = replica
+    try:
+        yield
+    finally:
+        _state.replica = None
+
+
+def use_replica(view: Callable) -> Callable:
+    """Выполняет view с чтением из реплики.
+
+    Не действует, если реплики не настроены или пользователь недавно
+    что-то записал.
+    """
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or STICKY_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        replica = random.choice(replicas)
+        with reading_from(replica):
+            response = view(request, *args, **kwargs)
+        if isinstance(response, StreamingHttpResponse):
+            response.streaming_content = stream_within(
+                lambda: reading_from(replica), response.streaming_content)
+        return response
+
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """Закрепляет пользователя за основной базой после записи."""
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,38 @@
+"""SQLite, настроенный для нескольких процессов-воркеров.
+
+При каждом подключении выполняются PRAGMA из OPTIONS['pragmas']
+поверх DEFAULT_PRAGMAS: журнал WAL позволяет читать во время
+записи, а busy_timeout заставляет ждать блокировку вместо ошибки
+"database is locked". busy_timeout берется из OPTIONS['timeout'],
+чтобы PRAGMA не перекрывала ожидание, заданное модулю sqlite3.
+"""
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_TIMEOUT = 5
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        if 'busy_timeout' in self.pragmas:
+            params['timeout'] = self.pragmas['busy_timeout'] / 1000
+        else:
+            self.pragmas['busy_timeout'] = int(
+                params.setdefault('timeout', DEFAULT_TIMEOUT) * 1000)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
@@ -0,0 +1,203 @@
+"""Профилирование запросов.
+
+Для выбранной доли запросов считает число и время SQL-запросов,
+время рендера шаблонов и время view. Итоги отдаются в заголовке
+Server-Timing, а медленные запросы пишутся в лог yatube.profiling.
+
+Замер шаблонов подменяет Template.render только пока идет хотя бы
+один профилируемый запрос. Потоковые ответы профилируются до конца
+потока: заголовок Server-Timing к этому времени уже отправлен и
+содержит замеры до начала потока, а в лог попадает весь запрос.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.template.base import Template
+
+from core.streaming import stream_within
+
+logger = logging.getLogger('yatube.profiling')
+
+_local = threading.local()
+_original_render = Template.render
+_active = 0
+_active_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.queries: List[Tuple[float, str]] = []
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.view_started: Optional[float] = None
+        self.view_time = 0.0
+        self.view_template_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper, замеряющая SQL."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_time += duration
+            self.queries.append((duration, sql))
+
+    def slowest(self, limit: int) -> List[Tuple[float, str]]:
+        return sorted(self.queries, reverse=True)[:limit]
+
+    @property
+    def total_time(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        metrics = [
+            ('sql', self.sql_time, f'{self.sql_count} queries'),
+            ('tpl', self.template_time, 'templates'),
+            ('view', self.view_time, 'view without templates'),
+            ('total', self.total_time, 'total'),
+        ]
+        return ', '.join(
+            f'{name};dur={seconds * 1000:.1f};desc="{desc}"'
+            for name, seconds, desc in metrics
+        )
+
+
+def _timed_render(self, context):
+    """Template.render с учетом времени в текущем профиле.
+
+    Вложенные шаблоны ({% include %}) не учитываются повторно.
+    """
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return _original_render(self, context)
+    profile.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_time += time.perf_counter() - started
+
+
+@contextmanager
+def timed_templates() -> Iterator[None]:
+    """Подменяет Template.render, пока идет хотя бы один профиль."""
+    global _active
+    with _active_lock:
+        _active += 1
+        if _active == 1:
+            Template.render = _timed_render
+    try:
+        yield
+    finally:
+        with _active_lock:
+            _active -= 1
+            if not _active:
+                Template.render = _original_render
+
+
+@contextmanager
+def profiling(profile: RequestProfile) -> Iterator[None]:
+    """Учитывает SQL и шаблоны текущего потока в profile."""
+    _local.profile = profile
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(timed_templates())
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(profile.execute))
+            yield
+    finally:
+        _local.profile = None
+
+
+@contextmanager
+def streamed_render(profile: RequestProfile) -> Iterator[None]:
+    """Шаг потокового рендера: все его время - время шаблонов."""
+    started = time.perf_counter()
+    with profiling(profile):
+        profile.template_depth += 1
+        try:
+            yield
+        finally:
+            profile.template_depth -= 1
+            profile.template_time += time.perf_counter() - started
+
+
+class ProfilingMiddleware:
+    """Собирает время SQL, шаблонов и view для доли запросов.
+
+    Настройки: PROFILING_SAMPLE_RATE - доля профилируемых запросов,
+    PROFILING_SLOW_REQUEST_MS и PROFILING_SLOW_QUERY_MS - пороги
+    записи в лог, PROFILING_TOP_QUERIES - сколько самых медленных
+    SQL-запросов писать в лог.
+    """
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = RequestProfile()
+        with profiling(profile):
+            response = self.get_response(request)
+        if profile.view_started is not None:
+            # Время view без рендера шаблонов, который идет внутри view.
+            templates = profile.template_time - profile.view_template_time
+            profile.view_time = (time.perf_counter() - profile.view_started
+                                 - templates)
+        response['Server-Timing'] = profile.server_timing()
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, profile, response.streaming_content)
+        else:
+            self.log(request, response, profile)
+        return response
+
+    def stream(self, request: HttpRequest, response: HttpResponse,
+               profile: RequestProfile,
+               chunks: Iterator[bytes]) -> Iterator[bytes]:
+        yield from stream_within(lambda: streamed_render(profile), chunks)
+        self.log(request, response, profile)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(_local, 'profile', None)
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+            profile.view_template_time = profile.template_time
+
+    def log(self, request: HttpRequest, response: HttpResponse,
+            profile: RequestProfile) -> None:
+        slow_query = settings.PROFILING_SLOW_QUERY_MS / 1000
+        slowest = profile.slowest(settings.PROFILING_TOP_QUERIES)
+        if (profile.total_time * 1000 < settings.PROFILING_SLOW_REQUEST_MS
+                and not any(duration >= slow_query
+                            for duration, _ in slowest)):
+            return
+        lines = [
+            f'{request.method} {request.get_full_path()} '
+            f'{response.status_code} {profile.total_time * 1000:.1f}ms '
+            f'sql={profile.sql_count}/{profile.sql_time * 1000:.1f}ms '
+            f'tpl={profile.template_time * 1000:.1f}ms '
+            f'view={profile.view_time * 1000:.1f}ms'
+        ]
+        lines += [f'  {duration * 1000:.1f}ms {sql}'
+                  for duration, sql in slowest]
+        logger.warning('\n'.join(lines))
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 
 
 class CreatedModel(models.Model):
@@ -11,3 +11,23 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class AtomicSaveModel(models.Model):
+
+    """Абстрактная модель. Сохраняет запись и выполняет обработчики
+    post_save в одной транзакции.
+
+    Django отправляет post_save после записи, и в режиме autocommit
+    производные данные (счетчики, ленты) обновлялись бы отдельной
+    транзакцией: сбой между ними оставлял бы их расхождение с записью.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,34 @@
+"""Плагин pytest: чистые кеши и бюджеты SQL-запросов."""
+
+import pytest
+
+from core.cache import isolated_caches
+from core.query_budget import enforce_query_budgets
+from core.testing import clear_caches, run_commit_callbacks
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_caches(django_test_environment):
+    """Подменяет кеши временными на весь прогон."""
+    with isolated_caches():
+        yield
+
+
+@pytest.fixture(scope='session', autouse=True)
+def commit_callbacks():
+    """Выполняет колбэки on_commit в транзакциях тестов."""
+    with run_commit_callbacks():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clean_caches(temporary_caches):
+    """Очищает временные кеши перед каждым тестом."""
+    clear_caches()
+
+
+@pytest.fixture(autouse=True)
+def query_budgets():
+    """Проверяет бюджеты SQL-запросов страниц во всех тестах."""
+    with enforce_query_budgets():
+        yield
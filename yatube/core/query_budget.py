@@ -0,0 +1,136 @@
+"""Бюджеты SQL-запросов страниц в тестах.
+
+Бюджеты задаются в settings.QUERY_BUDGETS по именам URL ('posts:index':
+4), для отдельного метода - с его префиксом ('POST posts:post_create').
+Это бюджеты обычной работы: счетчики пользователей созданы, миниатюры
+готовы. Для запросов холодного пути сначала ищется бюджет в
+settings.COLD_QUERY_BUDGETS: это запросы с загруженными файлами (после
+коммита генерируются миниатюры) и запросы внутри cold_path(), которым
+тест отмечает нарочно холодный случай, например пересчет счетчиков.
+Пока действует enforce_query_budgets(), каждый запрос тестового
+клиента считает свои SQL-запросы ко всем базам и падает с их списком,
+если страница вышла за бюджет. Запросы потокового ответа считаются при
+его чтении, и бюджет проверяется, когда ответ прочитан до конца. Для
+pytest бюджеты включает фикстура из core.pytest_plugin, для manage.py
+test - core.testing.TestRunner.
+"""
+
+from contextlib import ExitStack, contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+
+from core.streaming import stream_within
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Страница выполнила больше SQL-запросов, чем разрешено."""
+
+
+_cold_path: List[bool] = []
+
+
+@contextmanager
+def cold_path() -> Iterator[None]:
+    """Запросы блока проверяются по бюджетам холодного пути."""
+    _cold_path.append(True)
+    try:
+        yield
+    finally:
+        _cold_path.pop()
+
+
+def budget_for(method: str, path: str,
+               cold: bool = False) -> Optional[Tuple[str, int]]:
+    """Имя URL и бюджет запросов для метода и адреса или None."""
+    try:
+        view_name = resolve(urlsplit(path).path).view_name
+    except Resolver404:
+        return None
+    budgets = [settings.QUERY_BUDGETS]
+    if cold:
+        budgets.insert(0, settings.COLD_QUERY_BUDGETS)
+    for budget in budgets:
+        for key in (f'{method} {view_name}', view_name):
+            if key in budget:
+                return key, budget[key]
+    return None
+
+
+def check_budget(method: str, path: str, queries: List[dict],
+                 cold: bool = False) -> None:
+    """Проверяет, что запрос к path уложился в бюджет."""
+    found = budget_for(method, path, cold)
+    if found is None:
+        return
+    key, budget = found
+    if len(queries) <= budget:
+        return
+    statements = '\n'.join(
+        f'{number}. {query["sql"]}'
+        for number, query in enumerate(queries, start=1)
+    )
+    raise QueryBudgetExceeded(
+        f'{method} {path} ({key}): {len(queries)} SQL-запросов '
+        f'при бюджете {budget}:\n{statements}'
+    )
+
+
+@contextmanager
+def capturing(queries: List[dict]) -> Iterator[None]:
+    """Добавляет в queries SQL-запросы всех баз, выполненные в блоке."""
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(database))
+                    for database in connections.all()]
+        yield
+    for context in contexts:
+        queries.extend(context.captured_queries)
+
+
+def checked_stream(method: str, path: str, queries: List[dict],
+                   chunks: Iterable, cold: bool = False) -> Iterator:
+    """Потоковый ответ, проверяющий бюджет после последней порции."""
+    yield from stream_within(lambda: capturing(queries), chunks)
+    check_budget(method, path, queries, cold)
+
+
+@contextmanager
+def enforce_query_budgets():
+    """Проверяет бюджеты всех запросов тестового клиента."""
+    original = Client.request
+
+    def request(client, **environ):
+        queries = []
+        cold = bool(_cold_path)
+        with capturing(queries):
+            response = original(client, **environ)
+        request = getattr(response, 'wsgi_request', None)
+        cold = cold or bool(request is not None and request.FILES)
+        method = environ.get('REQUEST_METHOD', 'GET')
+        path = environ.get('PATH_INFO', '')
+        if response.streaming:
+            response.streaming_content = checked_stream(
+                method, path, queries, response.streaming_content, cold)
+        else:
+            check_budget(method, path, queries, cold)
+        return response
+
+    Client.request = request
+    try:
+        yield
+    finally:
+        Client.request = original
+
+
+class QueryBudgetRunner(DiscoverRunner):
+    """Тест-раннер, проверяющий бюджеты запросов во всех тестах."""
+
+    def run_suite(self, suite, **kwargs):
+        with enforce_query_budgets():
+            return super().run_suite(suite, **kwargs)
@@ -0,0 +1,283 @@
+"""Потоковый рендер страниц.
+
+stream_render отдает страницу через StreamingHttpResponse по мере
+рендера: все, что стоит в шаблоне перед первым блоком (в base.html -
+head и шапка), уходит клиенту сразу, дальше содержимое блоков
+отправляется порциями от STREAMING_BUFFER_SIZE символов. Циклы
+{% for %} по еще не выполненному queryset читают его через
+iterator(STREAMING_CHUNK_SIZE), не загружая в память целиком; число
+элементов считается отдельным запросом, только если шаблон обращается
+к forloop.revcounter. Узлы с методом stream(context) (например,
+{% cache %} из fragment_cache) отдают части сами. Все остальные теги
+рендерятся как обычно, так что шаблоны менять не нужно.
+
+Чтобы первые байты ушли до тяжелых запросов, view передает в контекст
+ленивые значения (SimpleLazyObject). Ошибка рендера после начала
+ответа уже не превратится в страницу 500, поэтому режим включается
+в каждом view отдельно и только при STREAMING_RENDER.
+
+Cookie CSRF ставится до начала ответа и только страницам, в шаблоне
+которых есть {% csrf_token %} (или для которых это указал view), как
+при обычном рендере.
+"""
+
+import sys
+from contextlib import AbstractContextManager
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template import Context
+from django.template.base import NodeList, Template
+from django.template.context import make_context
+from django.template.defaulttags import CsrfTokenNode, ForNode
+from django.template.loader import get_template
+from django.template.loader_tags import (BLOCK_CONTEXT_KEY, BlockContext,
+                                         BlockNode, ExtendsNode, IncludeNode)
+from django.utils.safestring import SafeString
+
+FLUSH = SafeString()
+
+
+def stream_nodes(nodelist: NodeList, context: Context) -> Iterator[str]:
+    """Рендер списка узлов по частям."""
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            yield from stream_extends(node, context)
+        elif isinstance(node, BlockNode):
+            yield FLUSH
+            yield from stream_block(node, context)
+        elif isinstance(node, ForNode):
+            yield from stream_for(node, context)
+        elif hasattr(node, 'stream'):
+            yield from node.stream(context)
+        else:
+            yield node.render_annotated(context)
+
+
+def stream_extends(node: ExtendsNode, context: Context) -> Iterator[str]:
+    """ExtendsNode.render по частям."""
+    compiled_parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    parent_extends = compiled_parent.nodelist.get_nodes_by_type(ExtendsNode)
+    if not parent_extends:
+        block_context.add_blocks({
+            block.name: block for block in
+            compiled_parent.nodelist.get_nodes_by_type(BlockNode)
+        })
+    with context.render_context.push_state(compiled_parent,
+                                           isolated_context=False):
+        yield from stream_nodes(compiled_parent.nodelist, context)
+
+
+def stream_block(node: BlockNode, context: Context) -> Iterator[str]:
+    """BlockNode.render по частям."""
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            yield from stream_nodes(node.nodelist, context)
+            return
+        push = block = block_context.pop(node.name)
+        if block is None:
+            block = node
+        block = type(node)(block.name, block.nodelist)
+        block.context = context
+        context['block'] = block
+        yield from stream_nodes(block.nodelist, context)
+        if push is not None:
+            block_context.push(node.name, push)
+
+
+def loop_values(node: ForNode,
+                context: Context) -> Tuple[Iterable, Callable[[], int]]:
+    """Значения цикла и функция, возвращающая их число.
+
+    Не выполненный queryset будет читаться порциями, а число элементов
+    для него считается запросом только при вызове функции.
+    """
+    values = node.sequence.resolve(context, ignore_failures=True)
+    if values is None:
+        return [], lambda: 0
+    if (isinstance(values, QuerySet) and values._result_cache is None
+            and not values._prefetch_related_lookups):
+        return (values.iterator(chunk_size=settings.STREAMING_CHUNK_SIZE),
+                values.count)
+    if not hasattr(values, '__len__'):
+        values = list(values)
+    return values, lambda: len(values)
+
+
+class ForLoop(dict):
+    """forloop, в котором revcounter считается при первом обращении."""
+
+    def __init__(self, length: Callable[[], int], **kwargs):
+        super().__init__(**kwargs)
+        self.length = length
+        self.len_values: Optional[int] = None
+
+    def __missing__(self, key):
+        if key not in ('revcounter', 'revcounter0'):
+            raise KeyError(key)
+        if self.len_values is None:
+            self.len_values = self.length()
+        revcounter = self.len_values - self['counter0']
+        return revcounter if key == 'revcounter' else revcounter - 1
+
+
+def lookahead(values: Iterable) -> Iterator[Tuple[object, bool]]:
+    """Элементы вместе с признаком, что элемент последний."""
+    values = iter(values)
+    try:
+        item = next(values)
+    except StopIteration:
+        return
+    for following in values:
+        yield item, False
+        item = following
+    yield item, True
+
+
+def bind_item(node: ForNode, context: Context, item) -> bool:
+    """Кладет элемент в контекст; True, если контекст нужно снять."""
+    if len(node.loopvars) == 1:
+        context[node.loopvars[0]] = item
+        return False
+    try:
+        len_item = len(item)
+    except TypeError:
+        len_item = 1
+    if len(node.loopvars) != len_item:
+        raise ValueError(f'Need {len(node.loopvars)} values to unpack in '
+                         f'for loop; got {len_item}. ')
+    context.update(dict(zip(node.loopvars, item)))
+    return True
+
+
+def stream_for(node: ForNode, context: Context) -> Iterator[str]:
+    """ForNode.render по частям."""
+    parentloop = context['forloop'] if 'forloop' in context else {}
+    with context.push():
+        values, length = loop_values(node, context)
+        if node.is_reversed:
+            values = reversed(list(values))
+        loop = context['forloop'] = ForLoop(length, parentloop=parentloop)
+        index = -1
+        for index, (item, last) in enumerate(lookahead(values)):
+            loop['counter0'] = index
+            loop['counter'] = index + 1
+            loop['first'] = index == 0
+            loop['last'] = last
+            pushed = bind_item(node, context, item)
+            yield from stream_nodes(node.nodelist_loop, context)
+            if pushed:
+                context.pop()
+        if index < 0:
+            del context['forloop']
+            yield node.nodelist_empty.render(context)
+
+
+def stream_template(template: Template, context: Context) -> Iterator[str]:
+    """Template.render по частям, склеенным в порции для отправки."""
+    buffer, size = [], 0
+    with context.render_context.push_state(template):
+        with context.bind_template(template):
+            context.template_name = template.name
+            for part in stream_nodes(template.nodelist, context):
+                buffer.append(part)
+                size += len(part)
+                if part is FLUSH or size >= settings.STREAMING_BUFFER_SIZE:
+                    if size:
+                        yield ''.join(buffer)
+                    buffer, size = [], 0
+    if size:
+        yield ''.join(buffer)
+
+
+def stream_within(context: Callable[[], AbstractContextManager],
+                  chunks: Iterable) -> Iterator:
+    """Выполняет каждый шаг итератора внутри контекста context().
+
+    Потоковый ответ рендерится уже после выхода из view и middleware,
+    так что их контекст (реплика, профилирование) нужно восстанавливать
+    на время получения каждой порции.
+    """
+    chunks = iter(chunks)
+    while True:
+        with context():
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def uses_csrf_token(template: Template) -> bool:
+    """Есть ли {% csrf_token %} в шаблоне, его родителях или включениях.
+
+    Шаблоны, имена которых вычисляются при рендере, не проверяются.
+    """
+    nodelist = template.nodelist
+    if nodelist.get_nodes_by_type(CsrfTokenNode):
+        return True
+    names = [node.parent_name.var
+             for node in nodelist.get_nodes_by_type(ExtendsNode)]
+    names += [node.template.var
+              for node in nodelist.get_nodes_by_type(IncludeNode)]
+    return any(uses_csrf_token(template.engine.get_template(name))
+               for name in names
+               if isinstance(name, str) and name != template.name)
+
+
+def extended_templates(template: Template) -> Iterator[Template]:
+    """Шаблон и его родители, имена которых известны до рендера."""
+    while template is not None:
+        yield template
+        names = [node.parent_name.var
+                 for node in template.nodelist.get_nodes_by_type(ExtendsNode)]
+        name = names[0] if names else None
+        template = (template.engine.get_template(name)
+                    if isinstance(name, str) and name != template.name
+                    else None)
+
+
+def stream_render(request: HttpRequest, template_name: str,
+                  context: dict = None,
+                  csrf: Optional[bool] = None) -> HttpResponse:
+    """Аналог render(), отдающий страницу потоком.
+
+    csrf - будет ли на странице {% csrf_token %}. По умолчанию это
+    определяется по шаблону, но тег под условием (например, форма только
+    для вошедших) view знает точнее. При выключенном STREAMING_RENDER
+    вызывает обычный render().
+    """
+    if not settings.STREAMING_RENDER:
+        return render(request, template_name, context)
+    template = get_template(template_name).template
+    render_context = make_context(context, request,
+                                  autoescape=template.engine.autoescape)
+    # Cookie CSRF и заголовок Vary: Cookie выставляют middleware, которые
+    # отработают раньше рендера, поэтому токен и сессию нужно тронуть
+    # до возврата ответа.
+    if csrf is None:
+        csrf = uses_csrf_token(template)
+    if csrf:
+        get_token(request)
+    request.user.is_authenticated
+    # Под тестами Template._render сообщает о рендере сигналом, из
+    # которого клиент собирает response.context. Потоковый рендер идет
+    # мимо _render и уже после ответа, поэтому сигнал отправляется здесь.
+    test_utils = sys.modules.get('django.test.utils')
+    if (test_utils is not None
+            and Template._render is test_utils.instrumented_test_render):
+        from django.test.signals import template_rendered
+        for rendered in extended_templates(template):
+            template_rendered.send(sender=rendered, template=rendered,
+                                   context=render_context)
+    return StreamingHttpResponse(stream_template(template, render_context))
@@ -0,0 +1,100 @@
+"""Тег {% cache %} с защитой от одновременного пересчета фрагментов.
+
+Синтаксис и ключи те же, что у встроенного тега из {% load cache %}, но
+фрагмент пересчитывается через core.cache.get_or_refresh: немного
+раньше срока и только одним запросом, пока остальные отдают старую
+копию. Настройки: FRAGMENT_CACHE_STALE, FRAGMENT_CACHE_BETA и
+FRAGMENT_CACHE_WAIT.
+
+Переменная feed_version среди аргументов - версия ленты. Смена версии
+дает новый ключ без старой копии, поэтому фрагмент хранится еще и под
+ключом без версии: пока один запрос рендерит новую версию, остальные
+отдают прошлую, а не рендерят ее все разом.
+
+При чтении из реплики фрагменты только читаются из кеша: отрендеренный
+по отстающей реплике фрагмент не должен жить под свежей версией.
+
+При потоковом рендере (core.streaming) пересчитываемый фрагмент
+отдается клиенту по частям, а в кеш попадает целиком после рендера.
+"""
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Library, TemplateSyntaxError, VariableDoesNotExist
+from django.templatetags.cache import CacheNode, do_cache
+
+from core.cache import refresh_chunks
+from core.db.replicas import current_replica
+from core.streaming import stream_nodes
+
+register = Library()
+
+VERSION_VARIABLE = 'feed_version'
+
+
+class RefreshingCacheNode(CacheNode):
+
+    def refresh(self, context, compute, join):
+        """Фрагмент через refresh_chunks с настройками тега."""
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+            cache_name = (self.cache_name.resolve(context)
+                          if self.cache_name else 'default')
+        except VariableDoesNotExist as error:
+            raise TemplateSyntaxError(f'"cache" tag got {error}')
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise TemplateSyntaxError(
+                    f'"cache" tag got a non-integer timeout: {expire_time!r}')
+        try:
+            fragment_cache = caches[cache_name]
+        except InvalidCacheBackendError:
+            raise TemplateSyntaxError(f'Invalid cache name: {cache_name!r}')
+        key, latest_key = self.keys(context)
+        return refresh_chunks(
+            fragment_cache,
+            key,
+            expire_time,
+            compute,
+            join,
+            stale=settings.FRAGMENT_CACHE_STALE,
+            beta=settings.FRAGMENT_CACHE_BETA,
+            wait=settings.FRAGMENT_CACHE_WAIT,
+            latest_key=latest_key,
+            read_only=current_replica() is not None,
+        )
+
+    def render(self, context):
+        [fragment] = self.refresh(
+            context, lambda: [self.nodelist.render(context)],
+            lambda parts: parts[0])
+        return fragment
+
+    def stream(self, context):
+        """Рендер по частям для core.streaming."""
+        return self.refresh(context,
+                            lambda: stream_nodes(self.nodelist, context),
+                            ''.join)
+
+    def keys(self, context):
+        """Ключ фрагмента и ключ его последней копии при любой версии."""
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        unversioned = [value for var, value in zip(self.vary_on, vary_on)
+                       if var.token != VERSION_VARIABLE]
+        if len(unversioned) == len(vary_on):
+            return key, None
+        return key, make_template_fragment_key(
+            f'{self.fragment_name}:latest', unversioned)
+
+
+@register.tag('cache')
+def do_refreshing_cache(parser, token):
+    """{% cache %} с ранним пересчетом и одним пересчетчиком."""
+    node = do_cache(parser, token)
+    return RefreshingCacheNode(node.nodelist, node.expire_time_var,
+                               node.fragment_name, node.vary_on,
+                               node.cache_name)
@@ -1,3 +1,6 @@
+from typing import List, Optional
+
+from django.core.paginator import Page
 from django.forms import BoundField
 
 from django import template
@@ -9,3 +12,21 @@ register = template.Library()
 def addclass(field: BoundField, css: str) -> str:
     """Фильтр для добавления CSS-классов в теги"""
     return field.as_widget(attrs={'class': css})
+
+
+@register.filter
+def page_window(page: Page, size: int = 2) -> List[Optional[int]]:
+    """Номера страниц вокруг текущей, первая и последняя.
+
+    None обозначает пропуск. Число элементов не зависит от числа
+    страниц.
+    """
+    last = page.paginator.num_pages
+    start = max(page.number - size, 1)
+    end = min(page.number + size, last)
+    numbers: List[Optional[int]] = list(range(start, end + 1))
+    if start > 1:
+        numbers[:0] = [1, None] if start > 2 else [1]
+    if end < last:
+        numbers += [None, last] if end < last - 1 else [last]
+    return numbers
@@ -0,0 +1,134 @@
+"""Общая подготовка тестового окружения для manage.py test и pytest.
+
+TestCase держит каждый тест в транзакции, которая в конце откатывается,
+поэтому колбэки transaction.on_commit в нем не выполняются никогда.
+run_commit_callbacks() выполняет их так, будто транзакции теста нет: сразу,
+если код теста не открыл своей транзакции, или при выходе из нее.
+"""
+
+import unittest
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import TestCase
+
+from core.cache import caches_isolated, isolated_caches
+from core.query_budget import QueryBudgetRunner
+
+
+def clear_caches() -> None:
+    """Очищает все кеши.
+
+    Общий кеш переживает процесс, а откат транзакции теста не сбрасывает
+    кеш, поэтому без очистки тесты увидели бы фрагменты, счетчики и
+    пользователей, оставшихся от прошлого запуска или соседнего теста.
+    Чистит только временные кеши из isolated_caches: настоящий кеш
+    сайта тесты трогать не должны.
+    """
+    if not caches_isolated():
+        raise RuntimeError('Кеши не изолированы, очистка задела бы кеш '
+                           'сайта; используйте isolated_caches().')
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+_test_levels: Dict[str, List[int]] = defaultdict(list)
+
+
+def _at_test_level(connection: BaseDatabaseWrapper) -> bool:
+    """Открыты ли сейчас только транзакции самого TestCase."""
+    levels = _test_levels[connection.alias]
+    return (bool(levels) and connection.in_atomic_block
+            and not connection.needs_rollback
+            and len(connection.savepoint_ids) == levels[-1])
+
+
+_enter_atomics = TestCase._enter_atomics.__func__
+_rollback_atomics = TestCase._rollback_atomics.__func__
+_on_commit = BaseDatabaseWrapper.on_commit
+_atomic_exit = transaction.Atomic.__exit__
+
+
+def _enter(cls):
+    atomics = _enter_atomics(cls)
+    for alias in atomics:
+        _test_levels[alias].append(len(connections[alias].savepoint_ids))
+    return atomics
+
+
+def _rollback(cls, atomics):
+    for alias in atomics:
+        _test_levels[alias].pop()
+    _rollback_atomics(cls, atomics)
+
+
+def _commit_callback(connection, func):
+    if _at_test_level(connection):
+        func()
+    else:
+        _on_commit(connection, func)
+
+
+def _exit_atomic(atomic, exc_type, exc_value, traceback):
+    result = _atomic_exit(atomic, exc_type, exc_value, traceback)
+    connection = transaction.get_connection(atomic.using)
+    if _at_test_level(connection) and connection.run_on_commit:
+        callbacks = connection.run_on_commit
+        connection.run_on_commit = []
+        for _, func in callbacks:
+            func()
+    return result
+
+
+@contextmanager
+def run_commit_callbacks() -> Iterator[None]:
+    """Выполняет on_commit внутри TestCase, как после настоящего коммита."""
+    TestCase._enter_atomics = classmethod(_enter)
+    TestCase._rollback_atomics = classmethod(_rollback)
+    BaseDatabaseWrapper.on_commit = _commit_callback
+    transaction.Atomic.__exit__ = _exit_atomic
+    try:
+        yield
+    finally:
+        TestCase._enter_atomics = classmethod(_enter_atomics)
+        TestCase._rollback_atomics = classmethod(_rollback_atomics)
+        BaseDatabaseWrapper.on_commit = _on_commit
+        transaction.Atomic.__exit__ = _atomic_exit
+
+
+class ClearCachesResult:
+    """Примесь к классу результата: чистые кеши перед каждым тестом."""
+
+    def startTest(self, test):
+        clear_caches()
+        super().startTest(test)
+
+
+class TestRunner(QueryBudgetRunner):
+    """Тест-раннер проекта: чистые кеши и бюджеты SQL-запросов.
+
+    Кеши на время прогона подменяются временными, так что их очистка
+    не трогает кеш запущенного рядом сайта. Колбэки on_commit
+    выполняются, см. run_commit_callbacks.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolated_caches = isolated_caches()
+        self._isolated_caches.__enter__()
+        self._run_commit_callbacks = run_commit_callbacks()
+        self._run_commit_callbacks.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._run_commit_callbacks.__exit__(None, None, None)
+        self._isolated_caches.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type('CacheClearingResult', (ClearCachesResult, base), {})
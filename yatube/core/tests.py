@@ -0,0 +1,533 @@
+import os
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.utils import OperationalError
+from django.http import StreamingHttpResponse
+from django.template import Context, engines
+from django.template.base import Template
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core import middleware
+from core.cache import caches_isolated, get_or_refresh, isolated_caches
+from core.db.replicas import STICKY_COOKIE, use_replica
+from core.query_budget import (QueryBudgetExceeded, check_budget,
+                               cold_path, enforce_query_budgets)
+from core.streaming import stream_template
+from core.testing import clear_caches
+from posts.models import Comment, Post, UserCounters
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+User = get_user_model()
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Post.objects.create(author=User.objects.create_user(username='A'),
+                            text='Пост')
+
+    def timings(self, response):
+        return {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_server_timing_header(self):
+        """Заголовок Server-Timing содержит SQL, шаблоны, view и итог."""
+        response = self.client.get('/')
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'sql', 'tpl', 'view', 'total'})
+        self.assertRegex(timings['sql'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(PROFILING_SAMPLE_RATE=0.0)
+    def test_not_sampled(self):
+        """Запросы вне выборки не профилируются."""
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0,
+                       PROFILING_SLOW_REQUEST_MS=0)
+    def test_slow_request_logged(self):
+        """Медленный запрос пишется в лог вместе с самыми долгими SQL."""
+        with self.assertLogs('yatube.profiling') as logs:
+            self.client.get('/')
+        self.assertIn('GET / 200', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_template_patch_only_while_profiling(self):
+        """Template.render подменяется только на время профиля."""
+        self.assertIs(Template.render, middleware._original_render)
+        response = self.client.get('/')
+        self.assertNotRegex(self.timings(response)['tpl'], r'dur=0\.0;')
+        self.assertIs(Template.render, middleware._original_render)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0,
+                       PROFILING_SLOW_REQUEST_MS=0, STREAMING_RENDER=True)
+    def test_streamed_page_profiled_to_the_end(self):
+        """SQL потокового рендера попадает в профиль и лог."""
+        response = self.client.get('/profile/A/')
+        self.assertTrue(response.streaming)
+        with self.assertLogs('yatube.profiling') as logs:
+            content = b''.join(response.streaming_content)
+        self.assertIn('Пост'.encode(), content)
+        self.assertIn('posts_post', logs.output[0])
+
+
+class QueryBudgetTests(TestCase):
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_budget_exceeded(self):
+        """Превышение бюджета роняет тест со списком SQL-запросов."""
+        with enforce_query_budgets():
+            with self.assertRaisesRegex(QueryBudgetExceeded,
+                                        r'\(posts:index\)[^\n]*\n1\. SELECT'):
+                self.client.get('/')
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0,
+                                      'GET posts:index': 100})
+    def test_method_budget_wins(self):
+        """Бюджет для метода важнее общего бюджета URL."""
+        with enforce_query_budgets():
+            self.assertEqual(self.client.get('/').status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={'GET posts:index': 0},
+                       COLD_QUERY_BUDGETS={'posts:index': 100})
+    def test_cold_path_budget(self):
+        """В cold_path() действует бюджет холодного пути."""
+        with enforce_query_budgets():
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/')
+            clear_caches()
+            with cold_path():
+                self.assertEqual(self.client.get('/').status_code, 200)
+
+
+class SQLiteProfileTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """PRAGMA профиля SQLite выполняются при подключении."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        self.assertEqual(self.pragma('busy_timeout'),
+                         connection.settings_dict['OPTIONS']['timeout'] * 1000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+@skipUnless(psycopg2, 'Нужен psycopg2')
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('psycopg2.pool.psycopg2.connect',
+                             side_effect=lambda *args, **kwargs:
+                             mock.MagicMock(closed=0))
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def database(self, **options):
+        from core.db.postgresql.base import DatabaseWrapper
+        database = DatabaseWrapper({
+            'ENGINE': 'core.db.postgresql', 'NAME': self._testMethodName,
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+            'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'TIME_ZONE': None, 'TEST': {},
+            'OPTIONS': {'pool_min_size': 0, **options},
+        }, alias='pool')
+        return database, database.get_connection_params()
+
+    def test_connection_returns_to_pool(self):
+        """Закрытое соединение возвращается в пул и выдается снова."""
+        database, params = self.database(pool_min_size=1, pool_max_size=2)
+        database.connection = database.get_new_connection(params)
+        first = database.connection
+        database._close()
+        self.assertIs(database.get_new_connection(params), first)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_exhausted_pool_raises_operational_error(self):
+        """Когда пул исчерпан, после ожидания бросается OperationalError."""
+        database, params = self.database(pool_max_size=1, pool_timeout=0)
+        database.get_new_connection(params)
+        with self.assertRaisesRegex(OperationalError, 'пула заняты'):
+            database.get_new_connection(params)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+
+    @staticmethod
+    @use_replica
+    def view(request):
+        return Post.objects.all().db
+
+    def test_reads_from_replica(self):
+        """Чтения во view с use_replica идут в реплику."""
+        read_db = self.view(RequestFactory().get('/'))
+        self.assertEqual(read_db, 'replica1')
+        self.assertEqual(Post.objects.all().db, 'default')
+
+    def test_sticky_after_write(self):
+        """После записи пользователь читает из основной базы."""
+        user = User.objects.create_user(username='Writer')
+        self.client.force_login(user)
+        response = self.client.post('/create/', {'text': 'Новый пост'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        request = RequestFactory().get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        read_db = self.view(request)
+        self.assertEqual(read_db, 'default')
+
+
+class LaggingReplicaTests(TestCase):
+    """Реплика - отдельный файл SQLite без последних записей основной."""
+
+    databases = {'default', 'lagging'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['lagging'] = {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        # Схема реплики создается без роутера, который не пускает миграции
+        # в реплики.
+        with mock.patch.object(router, 'routers', []):
+            call_command('migrate', database='lagging', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['lagging'].close()
+        del connections.databases['lagging']
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    @override_settings(DATABASE_REPLICAS=['lagging'])
+    def test_counters_created_on_primary(self):
+        """Счетчики без записи пересчитываются по основной базе."""
+        author = User.objects.create_user(username='Fresh')
+        User.objects.using('lagging').create(id=author.id,
+                                             username='Fresh')
+        Post.objects.create(author=author, text='Пост')
+        UserCounters.objects.filter(user=author).delete()
+        response = self.client.get('/profile/Fresh/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['quantity'], 1)
+        self.assertEqual(UserCounters.objects.get(user=author).post_count, 1)
+        self.assertFalse(
+            UserCounters.objects.using('lagging').filter(user=author).exists())
+
+    @override_settings(DATABASE_REPLICAS=['lagging'])
+    def test_streamed_response_reads_replica(self):
+        """Потоковый ответ читает из той же реплики, что и view."""
+        author = User.objects.create_user(username='Fresh')
+        User.objects.using('lagging').create(id=author.id,
+                                             username='Fresh')
+        Post.objects.using('lagging').bulk_create(
+            [Post(author_id=author.id, text='С реплики')])
+
+        def texts():
+            for post in Post.objects.all():
+                yield post.text
+
+        @use_replica
+        def view(request):
+            return StreamingHttpResponse(texts())
+
+        response = view(RequestFactory().get('/'))
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         'С реплики')
+
+    @override_settings(DATABASE_REPLICAS=['lagging'])
+    def test_cached_user_does_not_pin_replica(self):
+        """Пользователь из кеша не уводит чтения в реплику после записи."""
+        author = User.objects.create_user(username='Fresh')
+        User.objects.using('lagging').create(id=author.id,
+                                             username='Fresh')
+        self.client.get('/profile/Fresh/')
+        Post.objects.create(author=author, text='Только что написан')
+        self.client.cookies[STICKY_COOKIE] = '1'
+        response = self.client.get('/profile/Fresh/')
+        self.assertContains(response, 'Только что написан')
+
+    @override_settings(DATABASE_REPLICAS=['lagging'])
+    def test_lagging_page_is_not_cached(self):
+        """Страница по отстающей реплике не кешируется под новой версией."""
+        author = User.objects.create_user(username='Fresh')
+        post = Post.objects.create(author=author, text='Старый текст')
+        User.objects.using('lagging').create(id=author.id,
+                                             username='Fresh')
+        Post.objects.using('lagging').bulk_create(
+            [Post(id=post.id, author_id=author.id, text='Старый текст')])
+        post.text = 'Новый текст'
+        post.save()
+        # Счетчиков автора на реплике нет, и страница их пересчитывает.
+        with cold_path():
+            response = self.client.get('/profile/Fresh/')
+            self.assertContains(response, 'Старый текст')
+            self.assertNotIn('ETag', response)
+            Post.objects.using('lagging').filter(id=post.id).update(
+                text='Новый текст')
+            self.assertContains(self.client.get('/profile/Fresh/'),
+                                'Новый текст')
+
+    @override_settings(DATABASE_REPLICAS=['lagging'])
+    def test_api_counters_are_not_written(self):
+        """API считает недостающие счетчики по реплике и не сохраняет."""
+        author = User.objects.create_user(username='Fresh')
+        User.objects.using('lagging').create(id=author.id,
+                                             username='Fresh')
+        Post.objects.create(author=author, text='Пост')
+        UserCounters.objects.filter(user=author).delete()
+        response = self.client.get(reverse('api:query'), {
+            'query': '{ user(username: "Fresh") { post_count } }'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['user'],
+                         {'post_count': 0})
+        self.assertFalse(UserCounters.objects.filter(user=author).exists())
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_through_tiers(self):
+        """Промах локального уровня берет значение из общего."""
+        cache.set('key', 'value')
+        caches['local'].clear()
+        before = cache.stats()
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        after = cache.stats()
+        self.assertEqual(after['shared']['hits'],
+                         before.get('shared', {}).get('hits', 0) + 1)
+        self.assertEqual(after['local']['hits'],
+                         before.get('local', {}).get('hits', 0) + 1)
+
+    def test_keys_are_namespaced(self):
+        """Ключи в уровнях хранятся с префиксом приложения."""
+        cache.set('key', 'value')
+        made = cache.make_key('key')
+        self.assertTrue(made.startswith('yatube:'))
+        self.assertEqual(caches['shared'].get(made), 'value')
+
+    def test_incr_drops_local_copy(self):
+        """incr меняет общий уровень и не оставляет старое значение."""
+        cache.set('counter', 1)
+        cache.incr('counter', 2)
+        self.assertEqual(cache.get('counter'), 3)
+
+    def test_get_or_set_computes_once(self):
+        """get_or_set считает значение один раз и снимает блокировку."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(cache.get_or_set('key', compute), 'value')
+        self.assertEqual(cache.get_or_set('key', compute), 'value')
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(caches['shared'].get(cache.make_key('key:lock')))
+
+
+class IsolatedCachesTests(TestCase):
+
+    def test_clear_does_not_touch_outer_caches(self):
+        """Очистка временных кешей не задевает настоящие."""
+        cache.set('outer', 1)
+        with isolated_caches():
+            self.assertIsNone(cache.get('outer'))
+            cache.set('inner', 2)
+            cache.clear()
+        self.assertEqual(cache.get('outer'), 1)
+        self.assertIsNone(cache.get('inner'))
+
+    def test_tests_run_on_temporary_caches(self):
+        """Тесты работают с временными кешами и не чистят настоящие."""
+        self.assertTrue(caches_isolated())
+        self.assertNotEqual(caches['shared']._dir,
+                            settings.SHARED_CACHE['LOCATION'])
+        with mock.patch('core.cache._isolated', []):
+            with self.assertRaises(RuntimeError):
+                clear_caches()
+
+
+class GetOrRefreshTests(TestCase):
+
+    def setUp(self):
+        self.cache = caches['local']
+        self.cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+    def test_fresh_value_is_reused(self):
+        """Свежее значение не пересчитывается."""
+        get_or_refresh(self.cache, 'key', 60, self.compute)
+        value = get_or_refresh(self.cache, 'key', 60, self.compute)
+        self.assertEqual(value, 'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_is_refreshed(self):
+        """Истекшее значение пересчитывается."""
+        get_or_refresh(self.cache, 'key', 0, self.compute)
+        value = get_or_refresh(self.cache, 'key', 0, self.compute)
+        self.assertEqual(value, 'value 2')
+
+    def test_stale_value_served_while_refreshing(self):
+        """Пока другой запрос пересчитывает, отдается старое значение."""
+        get_or_refresh(self.cache, 'key', 0, self.compute)
+        self.cache.add('key:lock', 1)
+        value = get_or_refresh(self.cache, 'key', 0, self.compute)
+        self.assertEqual(value, 'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_previous_version_served_while_refreshing(self):
+        """После смены версии отдается копия прошлой, пока идет пересчет."""
+        get_or_refresh(self.cache, 'key:1', 60, self.compute,
+                       latest_key='key')
+        self.cache.add('key:2:lock', 1)
+        value = get_or_refresh(self.cache, 'key:2', 60, self.compute,
+                               latest_key='key', wait=0)
+        self.assertEqual(value, 'value 1')
+        self.assertEqual(self.calls, 1)
+        self.cache.delete('key:2:lock')
+        value = get_or_refresh(self.cache, 'key:2', 60, self.compute,
+                               latest_key='key')
+        self.assertEqual(value, 'value 2')
+
+    def test_locked_miss_computes_after_wait(self):
+        """Без старого значения запрос ждет пересчет и считает сам."""
+        self.cache.add('key:lock', 1)
+        value = get_or_refresh(self.cache, 'key', 60, self.compute, wait=0)
+        self.assertEqual(value, 'value 1')
+        self.assertIsNone(self.cache.get('key'))
+
+
+class StreamingRenderTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Streamer')
+        cls.post = Post.objects.create(author=cls.author, text='Длинный пост')
+        for number in range(30):
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   text=f'Комментарий {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_match_regular_render(self):
+        """Потоковый рендер дает ту же страницу, шапка идет первой."""
+        addresses = ['/posts/{}/'.format(self.post.id), '/profile/Streamer/']
+        for address in addresses:
+            with self.subTest(address=address):
+                with override_settings(STREAMING_RENDER=False):
+                    regular = self.client.get(address)
+                cache.clear()
+                with override_settings(STREAMING_RENDER=True):
+                    response = self.client.get(address)
+                    self.assertTrue(response.streaming)
+                    chunks = [chunk.decode()
+                              for chunk in response.streaming_content]
+                self.assertIn('</header>', chunks[0])
+                self.assertTrue(chunks[0].rstrip().endswith('<main>'))
+                self.assertEqual(''.join(chunks), regular.content.decode())
+
+    @override_settings(STREAMING_RENDER=True, STREAMING_BUFFER_SIZE=100)
+    def test_cached_fragment_streams(self):
+        """Пересчитываемый фрагмент отдается по частям, затем из кеша."""
+        address = '/posts/{}/'.format(self.post.id)
+        response = self.client.get(address)
+        self.assertEqual(response.context['post'], self.post)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        first = next(index for index, chunk in enumerate(chunks)
+                     if 'Комментарий 0' in chunk)
+        last = next(index for index, chunk in enumerate(chunks)
+                    if 'Комментарий 9' in chunk)
+        self.assertLess(first, last)
+        cached = self.client.get(address)
+        self.assertEqual(b''.join(cached.streaming_content).decode(),
+                         ''.join(chunks))
+
+    @override_settings(STREAMING_RENDER=True)
+    def test_csrf_cookie_only_for_pages_with_forms(self):
+        """Cookie CSRF ставится только страницам с формой."""
+        self.client.force_login(self.author)
+        pages = {'/posts/{}/'.format(self.post.id): True,
+                 '/profile/Streamer/': False}
+        for address, has_form in pages.items():
+            with self.subTest(address=address):
+                self.client.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+                response = self.client.get(address)
+                self.assertEqual(
+                    settings.CSRF_COOKIE_NAME in response.cookies, has_form)
+
+    @override_settings(STREAMING_RENDER=True)
+    def test_streamed_queries_count_towards_budget(self):
+        """Запросы потокового рендера входят в бюджет страницы."""
+        address = '/posts/{}/'.format(self.post.id)
+        with mock.patch('core.query_budget.check_budget',
+                        wraps=check_budget) as check:
+            response = self.client.get(address)
+            check.assert_not_called()
+            b''.join(response.streaming_content)
+        check.assert_called_once()
+        queries = check.call_args[0][2]
+        self.assertTrue(any('"posts_comment"' in query['sql']
+                            for query in queries))
+
+    @override_settings(STREAMING_CHUNK_SIZE=7)
+    def test_for_loop_reads_queryset_in_chunks(self):
+        """Цикл по queryset рендерится так же, как обычным рендером.
+
+        Число элементов считается запросом, только если оно нужно
+        шаблону (forloop.revcounter).
+        """
+        loops = {
+            '{{ forloop.counter }}{% if forloop.last %}.{% else %},'
+            '{% endif %}': 1,
+            '{{ forloop.revcounter }},{{ forloop.revcounter0 }};': 2,
+        }
+        comments = Comment.objects.order_by('id')
+        for body, queries in loops.items():
+            with self.subTest(body=body):
+                template = engines['django'].from_string(
+                    '{% for comment in comments %}' + body
+                    + '{% empty %}-{% endfor %}').template
+                expected = template.render(
+                    Context({'comments': comments.all()}))
+                with self.assertNumQueries(queries):
+                    streamed = ''.join(stream_template(
+                        template, Context({'comments': comments.all()})))
+                self.assertEqual(streamed, expected)
+                self.assertEqual(''.join(stream_template(
+                    template, Context({'comments': comments.none()}))), '-')
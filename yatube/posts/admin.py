@@ -3,8 +3,19 @@
 
 from typing import Tuple
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 
 from posts.models import Post, Group, Comment, Follow
+from search.backends import get_backend
+
+
+class SearchChangeList(ChangeList):
+    """Список, упорядоченный по релевантности, пока идет поиск."""
+
+    def get_ordering(self, request, queryset):
+        if self.query and ORDER_VAR not in self.params:
+            return ['-search_score', '-pk']
+        return super().get_ordering(request, queryset)
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +27,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter: Tuple[str, ...] = ('pub_date',)
     empty_value_display: str = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через поисковый индекс вместо LIKE по таблице."""
+        if not search_term:
+            return queryset, False
+        return get_backend().filter_queryset(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return SearchChangeList
+
 
 class GroupAdmin(admin.ModelAdmin):
     """Класс для админки групп"""
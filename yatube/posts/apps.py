@@ -4,6 +4,9 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = 'posts'
 
+    def ready(self):
+        import posts.signals  # noqa: F401
+
 
 class AboutConfig(AppConfig):
     name = 'about'
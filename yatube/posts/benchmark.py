@@ -0,0 +1,198 @@
+"""Нагрузочные замеры страниц постов на синтетических данных.
+
+seed() заполняет базу пользователями, группами, подписками, постами
+и комментариями в заданном масштабе, run() прогоняет страницы через
+тестовый клиент и считает перцентили времени ответа и число
+SQL-запросов. Результат - словарь, который можно сохранить в JSON и
+сравнить со следующим прогоном через compare().
+
+seed() и холодные замеры очищают кеш, поэтому команда benchmark
+запускает их во временной базе и в core.cache.isolated_caches().
+"""
+
+import math
+import random
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from faker import Faker
+
+from core.query_budget import capturing
+from posts import counters
+from posts.importer import bulk_insert
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+
+
+def seed(users: int = 100, groups: int = 10, posts: int = 1000,
+         follows: int = 10, comments: int = 2, batch_size: int = 1000,
+         random_seed: int = 0) -> Dict[str, int]:
+    """Создает синтетические данные.
+
+    follows - число подписок каждого пользователя, comments - число
+    комментариев к каждому посту. Посты распределяются по последнему
+    году и проходят ту же обработку, что и при импорте.
+    """
+    rng = random.Random(random_seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    prefix = f'bench{User.objects.count()}'
+
+    User.objects.bulk_create(
+        [User(username=f'{prefix}_{i}', password='!')
+         for i in range(users)])
+    user_ids = list(User.objects.filter(
+        username__startswith=f'{prefix}_').values_list('id', flat=True))
+    Group.objects.bulk_create([
+        Group(title=fake.word().capitalize(), slug=f'{prefix}-{i}',
+              description=fake.sentence())
+        for i in range(groups)
+    ])
+    group_ids = list(Group.objects.filter(
+        slug__startswith=f'{prefix}-').values_list('id', flat=True))
+
+    follow_rows = []
+    for user_id in user_ids:
+        authors = rng.sample(user_ids, min(follows + 1, len(user_ids)))
+        follow_rows += [Follow(user_id=user_id, author_id=author_id)
+                        for author_id in authors
+                        if author_id != user_id][:follows]
+    Follow.objects.bulk_create(follow_rows)
+    counters.recount(user_ids)
+
+    now = timezone.now()
+    post_ids = []
+    for start in range(0, posts, batch_size):
+        batch = [
+            Post(author_id=rng.choice(user_ids),
+                 group_id=rng.choice(group_ids + [None]),
+                 text=fake.paragraph(),
+                 pub_date=now - timedelta(
+                     seconds=rng.randrange(365 * 24 * 3600)))
+            for _ in range(min(batch_size, posts - start))
+        ]
+        post_ids += [post.id for post in bulk_insert(batch)]
+
+    comment_rows = []
+    for post_id in post_ids:
+        comment_rows += [
+            Comment(post_id=post_id, author_id=rng.choice(user_ids),
+                    text=fake.sentence())
+            for _ in range(comments)
+        ]
+    Comment.objects.bulk_create(comment_rows)
+    cache.clear()
+    return {
+        'users': len(user_ids),
+        'groups': len(group_ids),
+        'follows': Follow.objects.filter(user__in=user_ids).count(),
+        'posts': len(post_ids),
+        'comments': len(comment_rows),
+    }
+
+
+def percentile(values: List[float], percent: int) -> float:
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def measure(request: Callable[[], object], repeat: int,
+            cold: bool = False) -> Dict[str, float]:
+    """Замеряет repeat вызовов request: время в мс и число запросов.
+
+    Потоковый ответ рендерится при чтении, поэтому он читается до конца
+    внутри замера. Запросы считаются по всем базам, включая реплики.
+    """
+    timings, queries = [], []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        captured = []
+        with capturing(captured):
+            started = time.perf_counter()
+            response = request()
+            if response.streaming:
+                for _chunk in response.streaming_content:
+                    pass
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{response.status_code} от {response.request["PATH_INFO"]}')
+        queries.append(len(captured))
+    result = {f'p{percent}': round(percentile(timings, percent), 2)
+              for percent in PERCENTILES}
+    result['queries'] = max(queries)
+    return result
+
+
+def scenarios(client: Client) -> Dict[str, Callable]:
+    """Запросы к страницам постов от имени пользователя client."""
+    post = Post.objects.order_by('-pub_date').first()
+    group = Group.objects.filter(posts__isnull=False).first()
+    author = post.author
+    last_page = math.ceil(Post.objects.count() / settings.POSTS_PER_PAGE)
+    texts = iter(range(10 ** 9))
+    return {
+        'index': lambda: client.get(reverse('posts:index')),
+        'index_last_page': lambda: client.get(
+            reverse('posts:index'), {'page': last_page}),
+        'group_list': lambda: client.get(
+            reverse('posts:group_list', args=[group.slug])),
+        'profile': lambda: client.get(
+            reverse('posts:profile', args=[author.username])),
+        'post_detail': lambda: client.get(
+            reverse('posts:post_detail', args=[post.id])),
+        'follow_index': lambda: client.get(reverse('posts:follow_index')),
+        'post_create': lambda: client.post(
+            reverse('posts:post_create'),
+            {'text': f'Замер {next(texts)}'}),
+    }
+
+
+def run(repeat: int = 20, cold: bool = False,
+        only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Прогоняет сценарии и возвращает замеры по каждому."""
+    reader = User.objects.filter(follower__isnull=False).first()
+    client = Client()
+    client.force_login(reader)
+    results = {}
+    for name, request in scenarios(client).items():
+        if only and name not in only:
+            continue
+        request()
+        results[name] = measure(request, repeat, cold)
+    return results
+
+
+def compare(baseline: Dict[str, Dict[str, float]],
+            current: Dict[str, Dict[str, float]],
+            tolerance: float = 0.2) -> List[str]:
+    """Регрессии текущего прогона относительно базового.
+
+    Регрессия - рост p95 больше чем на tolerance или рост числа
+    SQL-запросов.
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {base["p95"]} -> {result["p95"]} мс')
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL {base["queries"]} -> {result["queries"]}')
+    return regressions
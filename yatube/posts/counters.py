@@ -0,0 +1,147 @@
+"""Денормализованные счетчики постов и подписок пользователей.
+
+Счетчики меняются атомарным UPDATE ... SET x = x + 1 из сигналов
+моделей Post и Follow, а пересчитываются пачками командой recount.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Count, F
+
+from posts.models import Follow, Post, UserCounters
+
+User = get_user_model()
+
+COUNTER_FIELDS = ('post_count', 'follower_count', 'following_count')
+TOTAL_POSTS_KEY = 'posts-total'
+
+
+def _count_by(queryset, field: str, ids) -> Dict[int, int]:
+    return dict(
+        queryset.filter(**{f'{field}__in': ids})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('id'))
+        .values_list(field, 'total')
+    )
+
+
+def _counts(user_ids: List[int],
+            using: Optional[str] = None) -> Dict[int, Dict[str, int]]:
+    """Точные значения счетчиков пользователей по постам и подпискам."""
+    posts = _count_by(Post.objects.using(using), 'author', user_ids)
+    followers = _count_by(Follow.objects.using(using), 'author', user_ids)
+    following = _count_by(Follow.objects.using(using), 'user', user_ids)
+    return {
+        user_id: {
+            'post_count': posts.get(user_id, 0),
+            'follower_count': followers.get(user_id, 0),
+            'following_count': following.get(user_id, 0),
+        }
+        for user_id in user_ids
+    }
+
+
+def counted(user_ids: Iterable[int]) -> Dict[int, UserCounters]:
+    """Несохраненные счетчики пользователей, посчитанные заново.
+
+    Только читает базу: подходит для запросов, которые ничего не должны
+    записывать.
+    """
+    return {user_id: UserCounters(user_id=user_id, **values)
+            for user_id, values in _counts(list(user_ids)).items()}
+
+
+def recount(user_ids: Iterable[int]) -> int:
+    """Точно пересчитывает счетчики пользователей.
+
+    Возвращает число исправленных записей.
+    """
+    ids = list(user_ids)
+    # Пересчет пишет в основную базу, поэтому и читать должен из нее,
+    # а не из отстающей реплики.
+    primary = DEFAULT_DB_ALIAS
+    with transaction.atomic(using=primary):
+        counts = _counts(ids, primary)
+        existing = UserCounters.objects.using(
+            primary).select_for_update().in_bulk(ids)
+        to_create, to_update = [], []
+        for user_id, values in counts.items():
+            counters = existing.get(user_id)
+            if counters is None:
+                to_create.append(UserCounters(user_id=user_id, **values))
+                continue
+            if any(getattr(counters, name) != value
+                   for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(counters, name, value)
+                to_update.append(counters)
+        UserCounters.objects.using(primary).bulk_create(
+            to_create, ignore_conflicts=True)
+        UserCounters.objects.using(primary).bulk_update(
+            to_update, COUNTER_FIELDS)
+    return len(to_create) + len(to_update)
+
+
+def get_counters(user: User) -> UserCounters:
+    """Счетчики пользователя; при отсутствии записи создает ее."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        recount([user.pk])
+        return UserCounters.objects.using(DEFAULT_DB_ALIAS).get(user=user)
+
+
+def increment(user_id: int, field: str, delta: int = 1) -> None:
+    """Атомарно меняет счетчик пользователя на delta."""
+    counters = UserCounters.objects.filter(user_id=user_id)
+    if delta < 0:
+        counters = counters.filter(**{f'{field}__gte': -delta})
+    updated = counters.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount([user_id])
+
+
+def table_estimate(model) -> Optional[int]:
+    """Оценка числа строк таблицы по статистике PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                       [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] <= 0:
+        return None
+    return int(row[0])
+
+
+def total_posts() -> int:
+    """Общее число постов для пагинатора главной.
+
+    Хранится в кеше и меняется сигналами создания и удаления постов;
+    после истечения POSTS_TOTAL_TTL берется из статистики таблицы или
+    пересчитывается. Статистике меньше APPROXIMATE_COUNT_MIN не
+    верим: на маленьких таблицах COUNT дешев, а ошибка оценки заметнее
+    всего. Пересчет после истечения делает один процесс, остальные
+    ждут его результат.
+    """
+
+    def count() -> int:
+        total = table_estimate(Post)
+        if total is None or total < settings.APPROXIMATE_COUNT_MIN:
+            return Post.objects.count()
+        return total
+
+    return cache.get_or_set(TOTAL_POSTS_KEY, count, settings.POSTS_TOTAL_TTL)
+
+
+def adjust_total_posts(delta: int) -> None:
+    """Меняет закешированное общее число постов на delta."""
+    try:
+        cache.incr(TOTAL_POSTS_KEY, delta)
+    except ValueError:
+        pass
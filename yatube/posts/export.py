@@ -0,0 +1,127 @@
+"""Потоковая выгрузка постов, комментариев и подписок.
+
+Строки читаются из базы порциями через QuerySet.iterator() и сразу
+превращаются в NDJSON или CSV, поэтому расход памяти не зависит от
+размера таблиц. Один и тот же генератор используется командой
+export_posts и view выгрузки.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+from posts.models import Comment, Follow, Post
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EXPORTS: Dict[str, Tuple[QuerySet, Tuple[str, ...]]] = {
+    'posts': (Post.objects.all(), (
+        'id', 'author__username', 'group__slug', 'text', 'pub_date',
+        'image',
+    )),
+    'comments': (Comment.objects.all(), (
+        'id', 'post_id', 'author__username', 'text', 'pub_date',
+    )),
+    'follows': (Follow.objects.all(), (
+        'id', 'user__username', 'author__username',
+    )),
+}
+
+
+class ExportError(ValueError):
+    """Неизвестный вид выгрузки, формат или фильтр."""
+
+
+def export_queryset(kind: str, author: Optional[str] = None,
+                    group: Optional[str] = None,
+                    since: Optional[datetime] = None,
+                    until: Optional[datetime] = None) -> QuerySet:
+    """Queryset выгрузки с фильтрами по автору, группе и датам.
+
+    Для подписок фильтр по автору выбирает подписки на него, а
+    фильтры по группе и датам не применяются.
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f'Неизвестная выгрузка: {kind}')
+    queryset, fields = EXPORTS[kind]
+    if author:
+        queryset = queryset.filter(author__username=author)
+    if kind != 'follows':
+        if group:
+            lookup = 'group__slug' if kind == 'posts' else 'post__group__slug'
+            queryset = queryset.filter(**{lookup: group})
+        if since:
+            queryset = queryset.filter(pub_date__gte=since)
+        if until:
+            queryset = queryset.filter(pub_date__lt=until)
+    return queryset.order_by('id').values(*fields)
+
+
+def _rows(queryset: QuerySet) -> Iterator[dict]:
+    return queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def ndjson_lines(queryset: QuerySet) -> Iterator[str]:
+    """По одному JSON-объекту на строку."""
+    for row in _rows(queryset):
+        yield json.dumps(row, cls=DjangoJSONEncoder,
+                         ensure_ascii=False) + '\n'
+
+
+def csv_lines(queryset: QuerySet) -> Iterator[str]:
+    """CSV с заголовком; каждая строка отдается сразу после записи."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fields = queryset.query.values_select
+
+    def line(values) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(fields)
+    for row in _rows(queryset):
+        yield line(
+            value.isoformat() if isinstance(value, (date, datetime))
+            else value
+            for value in (row[field] for field in fields)
+        )
+
+
+def encode(lines: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """Кодирует строки в UTF-8 и при необходимости сжимает в gzip.
+
+    Сжатый поток отдается порциями по мере заполнения буфера zlib.
+    """
+    if not compress:
+        for line in lines:
+            yield line.encode()
+        return
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export(kind: str, fmt: str = 'ndjson', compress: bool = False,
+           **filters) -> Iterator[bytes]:
+    """Поток байтов выгрузки kind в формате fmt."""
+    if fmt not in FORMATS:
+        raise ExportError(f'Неизвестный формат: {fmt}')
+    queryset = export_queryset(kind, **filters)
+    lines = ndjson_lines(queryset) if fmt == 'ndjson' else csv_lines(queryset)
+    return encode(lines, compress)
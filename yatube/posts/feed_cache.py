@@ -0,0 +1,209 @@
+"""Версии кешированных фрагментов лент.
+
+Ключ фрагмента в шаблоне включает версию ленты. Изменения постов,
+комментариев и подписок сбрасывают версии только затронутых лент,
+поэтому время жизни фрагментов может быть большим.
+
+Те же версии служат валидаторами условных GET-запросов: conditional_feed
+отвечает 304, пока версии лент страницы не изменились, не выполняя
+view.
+
+Новая версия ставится после коммита изменения. Отстающая реплика в этот
+момент может еще отдавать старые данные, поэтому чтения из реплики
+версий не создают, фрагменты в кеш не кладут и ETag не отдают: иначе
+устаревшая страница жила бы под свежей версией до следующего сброса.
+"""
+
+import hashlib
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from core.db.replicas import current_replica
+from posts.models import Comment, Follow, Post
+
+VERSION_KEY = 'feed-version:{}'
+
+
+def index_feed() -> str:
+    return 'index'
+
+
+def group_feed(group_id: int) -> str:
+    return f'group:{group_id}'
+
+
+def profile_feed(author_id: int) -> str:
+    return f'profile:{author_id}'
+
+
+def follow_feed(user_id: int) -> str:
+    return f'follow:{user_id}'
+
+
+def post_feed(post_id: int) -> str:
+    return f'post:{post_id}'
+
+
+def feed_versions(*feeds: str) -> List[int]:
+    """Текущие версии лент.
+
+    Версия - время в наносекундах последнего изменения ленты или, если
+    версии в кеше нет, первого чтения из основной базы. Чтение из
+    реплики получает для недостающих лент разовые версии, которые не
+    сохраняются.
+    """
+    keys = [VERSION_KEY.format(feed) for feed in feeds]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing and current_replica() is None:
+        cache.set_many(missing, timeout=None)
+    versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def feed_version(*feeds: str) -> str:
+    """Текущая версия набора лент для ключа фрагмента."""
+    return '.'.join(str(version) for version in feed_versions(*feeds))
+
+
+def feed_cache_context(*feeds: str) -> Dict[str, object]:
+    """Переменные контекста для тега {% cache %} в шаблонах лент."""
+    return {
+        'feed_version': feed_version(*feeds),
+        'feed_cache_ttl': settings.FEED_CACHE_TTL,
+    }
+
+
+def bump(feeds: Iterable[str]) -> None:
+    """Дает лентам новые версии после коммита текущей транзакции."""
+    keys = [VERSION_KEY.format(feed) for feed in feeds]
+    if not keys:
+        return
+
+    def set_versions():
+        version = time.time_ns()
+        cache.set_many({key: version for key in keys}, timeout=None)
+
+    transaction.on_commit(set_versions)
+
+
+def bump_in_batches(feeds: Iterable[str]) -> None:
+    """bump() для длинного потока лент пачками по TIMELINE_BATCH_SIZE."""
+    batch = []
+    for feed in feeds:
+        batch.append(feed)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            bump(batch)
+            batch = []
+    bump(batch)
+
+
+def bump_followers(author_ids: Iterable[int]) -> None:
+    """Сбрасывает ленты подписок всех подписчиков авторов."""
+    readers = Follow.objects.filter(
+        author__in=author_ids).values_list('user_id', flat=True).distinct()
+    bump_in_batches(follow_feed(reader) for reader in readers.iterator())
+
+
+def bump_post_feeds(post, group_ids: Iterable[Optional[int]]) -> None:
+    """Сбрасывает версии всех лент, где показывается пост."""
+    feeds = [
+        index_feed(),
+        profile_feed(post.author_id),
+        post_feed(post.pk),
+    ]
+    feeds += [group_feed(group_id)
+              for group_id in set(group_ids) if group_id]
+    bump(feeds)
+    bump_followers([post.author_id])
+
+
+def bump_author_feeds(author_id: int) -> None:
+    """Сбрасывает ленты, где показаны имя и профиль пользователя.
+
+    Это лента автора, главная, группы и ленты подписок с его постами и
+    страницы постов с его комментариями.
+    """
+    group_ids = Post.objects.filter(author_id=author_id).exclude(
+        group=None).values_list('group_id', flat=True).distinct()
+    bump([index_feed(), profile_feed(author_id)]
+         + [group_feed(group_id) for group_id in group_ids])
+    bump_followers([author_id])
+    post_ids = Comment.objects.filter(author_id=author_id).values_list(
+        'post_id', flat=True).distinct()
+    bump_in_batches(post_feed(post_id) for post_id in post_ids.iterator())
+
+
+def feed_etag(request: HttpRequest, versions: List[int],
+              forms: bool = False) -> str:
+    """ETag страницы по адресу, пользователю и версиям ее лент."""
+    validator = (f'{request.get_full_path()}|{request.user.pk}|'
+                 f'{".".join(map(str, versions))}')
+    if forms:
+        validator += f'|{request.META.get("CSRF_COOKIE", "")}'
+    return quote_etag(hashlib.md5(validator.encode()).hexdigest())
+
+
+def set_validators(request: HttpRequest, response: HttpResponse, etag: str,
+                   last_modified: Optional[int]) -> None:
+    """Заголовки условных запросов для ответа страницы ленты."""
+    patch_cache_control(response, no_cache=True)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    # Страница из реплики может отставать от версий лент.
+    if response.status_code == 200 and current_replica() is not None:
+        return
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+
+def conditional_feed(feeds: Callable[..., Optional[Iterable[str]]],
+                     forms: bool = False):
+    """Декоратор view: ответ 304, если ленты страницы не менялись.
+
+    feeds получает аргументы view и возвращает ленты, от которых
+    зависит страница, или None, если проверка невозможна (например,
+    объекта нет). ETag учитывает адрес с параметрами и пользователя,
+    Last-Modified отдается только анонимам: страница пользователя
+    меняется и при входе и выходе, а дата этого не отражает. Кеши
+    обязаны перепроверять ответ при каждом запросе (no-cache).
+
+    Для страниц с формами (forms=True) ETag учитывает и CSRF-токен:
+    после повторного входа токен меняется, и браузер не получит 304
+    со старым токеном в форме.
+    """
+
+    def decorator(view: Callable) -> Callable:
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_feeds = feeds(request, *args, **kwargs)
+            if page_feeds is None:
+                return view(request, *args, **kwargs)
+            versions = feed_versions(*page_feeds)
+            etag = feed_etag(request, versions, forms)
+            last_modified = None
+            if request.user.is_anonymous:
+                last_modified = max(versions) // 10 ** 9 + 1
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                set_validators(request, response, etag, last_modified)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,250 @@
+"""Пакетный импорт постов из NDJSON и CSV.
+
+Посты вставляются через bulk_create, который не отправляет сигналы
+моделей. Поэтому после каждой пачки импорт сам обновляет то, что
+обычно делают обработчики сигналов: счетчики авторов, ленты
+подписок, поисковый индекс и версии кеша лент.
+"""
+
+import csv
+import json
+import os
+from typing import (IO, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Union)
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections, router, transaction
+from django.db.models import Model, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, feed_cache, timeline
+from posts.models import Group, Post
+from search.backends import get_backend
+
+User = get_user_model()
+
+FORMATS = ('ndjson', 'csv')
+
+
+class RowError(ValueError):
+    """Строку нельзя импортировать."""
+
+
+def read_rows(stream: IO[str],
+              fmt: str = 'ndjson') -> Iterator[Union[dict, RowError]]:
+    """Читает строки входного файла по одной.
+
+    Вместо строки NDJSON, которая не разбирается или не является
+    объектом, отдается RowError: импорт пропускает ее, а не падает
+    посреди файла.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield RowError(f'Строка {number}: некорректный JSON')
+            continue
+        if not isinstance(row, dict):
+            yield RowError(f'Строка {number}: ожидался объект')
+            continue
+        yield row
+
+
+class LookupCache:
+    """Кеш объектов по ключу; промахи загружаются одним запросом."""
+
+    def __init__(self, queryset: QuerySet, field: str,
+                 create: Optional[Callable[[str], Model]] = None):
+        self.queryset = queryset
+        self.field = field
+        self.create = create
+        self.objects: Dict[str, Optional[Model]] = {}
+
+    def prefetch(self, keys: Iterable[str]) -> None:
+        missing = {key for key in keys if key and key not in self.objects}
+        if not missing:
+            return
+        found = self.queryset.in_bulk(missing, field_name=self.field)
+        for key in missing:
+            if key not in found and self.create is not None:
+                found[key] = self.create(key)
+            self.objects[key] = found.get(key)
+
+    def get(self, key: str) -> Optional[Model]:
+        return self.objects.get(key)
+
+
+def after_insert(posts: List[Post]) -> None:
+    """Делает то, что при create() делают обработчики сигналов."""
+    author_ids = {post.author_id for post in posts}
+    counters.recount(author_ids)
+    counters.adjust_total_posts(len(posts))
+    timeline.fan_out_posts(posts)
+    get_backend().index_posts(posts)
+    feeds = [feed_cache.index_feed()]
+    feeds += [feed_cache.profile_feed(author_id) for author_id in author_ids]
+    feeds += [feed_cache.group_feed(group_id)
+              for group_id in {post.group_id for post in posts} if group_id]
+    feed_cache.bump(feeds)
+    feed_cache.bump_followers(author_ids)
+
+
+def bulk_insert(posts: List[Post]) -> List[Post]:
+    """Вставляет посты одной транзакцией с сохранением pub_date.
+
+    bulk_create проставил бы pub_date из auto_now_add, поэтому посты
+    вставляются в режиме raw, как при loaddata: значения полей пишутся
+    как есть. Если СУБД не возвращает id вставленных строк (SQLite), они
+    читаются сразу после вставки пачки: до коммита база заблокирована на
+    запись, и последние id принадлежат этой пачке.
+    """
+    if not posts:
+        return []
+    using = router.db_for_write(Post)
+    database = connections[using]
+    fields = [field for field in Post._meta.concrete_fields
+              if field is not Post._meta.auto_field]
+    batch_size = max(database.ops.bulk_batch_size(fields, posts), 1)
+    queryset = Post.objects.using(using)
+    with transaction.atomic(using=using):
+        for start in range(0, len(posts), batch_size):
+            batch = posts[start:start + batch_size]
+            ids = queryset._insert(
+                batch, fields=fields, raw=True,
+                return_id=database.features.can_return_ids_from_bulk_insert)
+            if not ids:
+                ids = sorted(queryset.order_by('-id').values_list(
+                    'id', flat=True)[:len(batch)])
+            elif not isinstance(ids, list):
+                ids = [ids]
+            for post, post_id in zip(batch, ids):
+                post.pk = post_id
+                post._state.adding = False
+                post._state.db = using
+        after_insert(posts)
+    return posts
+
+
+class PostImporter:
+    """Импортирует посты пачками по batch_size в отдельных транзакциях.
+
+    Авторы и группы ищутся по username и slug (ключи author или
+    author__username, group или group__slug, как в выгрузке
+    export_posts). Картинки копируются из images_dir в хранилище.
+    """
+
+    def __init__(self, batch_size: int = 1000,
+                 images_dir: Optional[str] = None,
+                 create_missing: bool = False):
+        self.batch_size = batch_size
+        self.images_dir = images_dir
+        self.authors = LookupCache(
+            User.objects.all(), 'username',
+            create=self._create_user if create_missing else None)
+        self.groups = LookupCache(
+            Group.objects.all(), 'slug',
+            create=self._create_group if create_missing else None)
+        self.skipped = 0
+        self.warnings: List[str] = []
+
+    @staticmethod
+    def _create_user(username: str) -> User:
+        return User.objects.create_user(username=username)
+
+    @staticmethod
+    def _create_group(slug: str) -> Group:
+        return Group.objects.create(title=slug, slug=slug, description='')
+
+    def _image_path(self, name: str) -> Optional[str]:
+        """Файл картинки внутри images_dir или None, если его нет.
+
+        Имя берется из входного файла, поэтому абсолютные пути, .. и
+        ссылки, ведущие за пределы каталога, отвергаются.
+        """
+        parts = name.replace('\\', '/').split('/')
+        if os.path.isabs(name) or '..' in parts:
+            raise RowError(f'Недопустимое имя картинки {name}')
+        root = os.path.realpath(self.images_dir)
+        for candidate in (name, parts[-1]):
+            path = os.path.realpath(os.path.join(root, candidate))
+            if os.path.commonpath([root, path]) != root:
+                raise RowError(f'Картинка {name} вне каталога картинок')
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _image(self, name: str) -> Optional[str]:
+        if not name or not self.images_dir:
+            return None
+        path = self._image_path(name)
+        if path is None:
+            self.warnings.append(f'Нет картинки {name}')
+            return None
+        field = Post._meta.get_field('image')
+        with open(path, 'rb') as file:
+            return default_storage.save(
+                field.generate_filename(None, os.path.basename(path)),
+                File(file))
+
+    def build(self, row: dict) -> Post:
+        """Пост из строки входного файла без сохранения."""
+        username = row.get('author') or row.get('author__username')
+        author = self.authors.get(username)
+        if author is None:
+            raise RowError(f'Нет автора {username}')
+        slug = row.get('group') or row.get('group__slug')
+        group = self.groups.get(slug) if slug else None
+        if slug and group is None:
+            raise RowError(f'Нет группы {slug}')
+        text = row.get('text')
+        if not text:
+            raise RowError('Пустой текст')
+        pub_date = timezone.now()
+        if row.get('pub_date'):
+            pub_date = parse_datetime(row['pub_date'])
+            if pub_date is None:
+                raise RowError(f'Неверная дата {row["pub_date"]}')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(author=author, group=group, text=text,
+                    pub_date=pub_date, image=self._image(row.get('image')))
+
+    def skip(self, error: RowError) -> None:
+        self.skipped += 1
+        self.warnings.append(str(error))
+
+    def insert(self, rows: List[dict]) -> int:
+        """Вставляет одну пачку; возвращает число новых постов."""
+        self.authors.prefetch(
+            row.get('author') or row.get('author__username') for row in rows)
+        self.groups.prefetch(
+            row.get('group') or row.get('group__slug') for row in rows)
+        posts = []
+        for row in rows:
+            try:
+                posts.append(self.build(row))
+            except RowError as error:
+                self.skip(error)
+        return len(bulk_insert(posts))
+
+    def batches(self, rows: Iterable[Union[dict, RowError]]) -> Iterator[int]:
+        """Импортирует строки пачками, отдавая размер каждой пачки."""
+        batch = []
+        for row in rows:
+            if isinstance(row, RowError):
+                self.skip(row)
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield self.insert(batch)
+                batch = []
+        if batch:
+            yield self.insert(batch)
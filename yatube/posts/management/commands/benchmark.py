@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.cache import isolated_caches
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа страниц постов на синтетических данных '
+            'во временной базе и временном кеше')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Подписок у каждого пользователя')
+        parser.add_argument('--comments', type=int, default=3,
+                            help='Комментариев к каждому посту')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Запросов к каждой странице')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                            help='Замерять только эти сценарии')
+        parser.add_argument('--output', '-o', help='Файл для JSON-отчета')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='JSON-отчет прошлого прогона')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95, доля')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = json.load(file)['results']
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'Не удалось прочитать отчет: {error}')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with isolated_caches():
+                scale = benchmark.seed(
+                    users=options['users'], groups=options['groups'],
+                    posts=options['posts'], follows=options['follows'],
+                    comments=options['comments'])
+                results = benchmark.run(options['repeat'], options['cold'],
+                                        options['only'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report = json.dumps({
+            'scale': scale,
+            'repeat': options['repeat'],
+            'cold': options['cold'],
+            'results': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+        if baseline is None:
+            return
+        regressions = benchmark.compare(baseline, results,
+                                        options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from posts.export import EXPORTS, FORMATS, ExportError, export
+
+
+def datetime_arg(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает посты, комментарии или подписки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS),
+                            help='Что выгружать')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson',
+                            help='Формат выгрузки')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Сжать выгрузку gzip')
+        parser.add_argument('--output', '-o',
+                            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--author', help='Имя пользователя автора')
+        parser.add_argument('--group', help='Адрес группы')
+        parser.add_argument('--since', type=datetime_arg,
+                            help='Не раньше даты (ISO 8601)')
+        parser.add_argument('--until', type=datetime_arg,
+                            help='Раньше даты (ISO 8601)')
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export(
+                options['kind'], options['format'], options['gzip'],
+                author=options['author'], group=options['group'],
+                since=options['since'], until=options['until'],
+            )
+        except ExportError as error:
+            raise CommandError(error)
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stderr.write(self.style.SUCCESS(
+                f'Выгрузка записана в {options["output"]}'))
+            return
+        output = getattr(self.stdout, 'buffer', None)
+        if output is None:
+            if options['gzip']:
+                raise CommandError('Для --gzip укажите --output')
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
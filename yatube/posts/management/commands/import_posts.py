@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import FORMATS, PostImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Пакетно импортирует посты из NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для импорта, - для stdin')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат, по умолчанию - по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько постов вставлять за одну транзакцию'
+        )
+        parser.add_argument('--images', help='Каталог с картинками постов')
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать отсутствующих авторов и группы'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson')
+        if options['images'] and not os.path.isdir(options['images']):
+            raise CommandError(f'Нет каталога {options["images"]}')
+        importer = PostImporter(options['batch_size'], options['images'],
+                                options['create_missing'])
+        if path == '-':
+            stream = nullcontext(sys.stdin)
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+        started = time.monotonic()
+        imported = 0
+        with stream as lines:
+            for count in importer.batches(read_rows(lines, fmt)):
+                imported += count
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'Импортировано {imported} '
+                    f'({imported / elapsed:.0f} строк/с)')
+        for warning in importer.warnings:
+            self.stderr.write(warning)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {imported}, '
+            f'пропущено строк: {importer.skipped}'))
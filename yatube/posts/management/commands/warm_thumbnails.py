@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import cached_thumbnail, generate_thumbnail
+
+
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def missing_thumbnails(images):
+    for image in images:
+        if cached_thumbnail(image) is None:
+            yield image.name
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Число параллельных процессов'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10,
+            help='Сколько картинок отдавать процессу за раз'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        images = [post.image for post in posts.only('image').iterator()]
+        names = list(missing_thumbnails(images))
+        connections.close_all()
+        created = 0
+        with multiprocessing.Pool(options['processes'],
+                                  initializer=init_worker) as pool:
+            for ok in pool.imap_unordered(generate_thumbnail, names,
+                                          options['chunk_size']):
+                created += ok
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {created} из {len(names)}'))
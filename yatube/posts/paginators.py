@@ -0,0 +1,160 @@
+"""Пагинаторы для лент постов"""
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from typing import Callable, Optional, Tuple, Union
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Model, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(obj: Union[Model, dict]) -> str:
+    """Кодирует ключ (pub_date, id) объекта или строки values()."""
+    if isinstance(obj, dict):
+        pub_date, pk = obj['pub_date'], obj['id']
+    else:
+        pub_date, pk = obj.pub_date, obj.pk
+    raw = f'{pub_date.isoformat()}|{pk}'
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Cursor]:
+    """Декодирует токен курсора; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        raw = urlsafe_b64decode(token.encode()).decode()
+        pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (BinasciiError, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница курсорного пагинатора.
+
+    Не знает своего номера и общего числа страниц, зато умеет отдавать
+    токены соседних страниц.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        super().__init__(object_list, None, paginator)
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return (f'<CursorPage before={self.paginator.before_token} '
+                f'after={self.paginator.after_token}>')
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def next_cursor(self) -> Optional[str]:
+        """Токен последней записи - начало следующей страницы."""
+        if not self._has_next:
+            return None
+        return encode_cursor(self.object_list[-1])
+
+    def previous_cursor(self) -> Optional[str]:
+        """Токен первой записи - конец предыдущей страницы."""
+        if not self._has_previous:
+            return None
+        return encode_cursor(self.object_list[0])
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Не выполняет COUNT и не использует OFFSET: каждая страница -
+    это выборка per_page + 1 строк по индексу от позиции курсора.
+    Токен before выбирает записи старше курсора, after - новее.
+    Для newest_first=False следующая страница - более новые записи.
+    """
+
+    def __init__(self, object_list: QuerySet, per_page: int,
+                 before: Optional[str] = None,
+                 after: Optional[str] = None,
+                 newest_first: bool = True):
+        super().__init__(object_list, per_page)
+        self.before = decode_cursor(before)
+        self.after = None if self.before else decode_cursor(after)
+        self.before_token = before if self.before else None
+        self.after_token = after if self.after else None
+        self.newest_first = newest_first
+
+    def _check_object_list_is_ordered(self):
+        """Порядок задается ключом курсора, а не исходным queryset."""
+
+    def get_page(self, number=None) -> CursorPage:
+        return self.page(number)
+
+    def _after(self, queryset: QuerySet, cursor: Cursor) -> QuerySet:
+        pub_date, pk = cursor
+        return queryset.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+        ).order_by('pub_date', 'id')
+
+    def _before(self, queryset: QuerySet, cursor: Cursor) -> QuerySet:
+        pub_date, pk = cursor
+        return queryset.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+        ).order_by('-pub_date', '-id')
+
+    def page(self, number=None) -> CursorPage:
+        """Возвращает страницу, заданную курсором, номер игнорируется."""
+        limit = self.per_page + 1
+        if self.newest_first:
+            forward, backward = self.before, self.after
+            go_forward, go_backward = self._before, self._after
+            ordering = ('-pub_date', '-id')
+        else:
+            forward, backward = self.after, self.before
+            go_forward, go_backward = self._after, self._before
+            ordering = ('pub_date', 'id')
+        if backward:
+            items = list(go_backward(self.object_list, backward)[:limit])
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            return CursorPage(items, self, has_previous, bool(items))
+        queryset = self.object_list.order_by(*ordering)
+        if forward:
+            queryset = go_forward(queryset, forward)
+        items = list(queryset[:limit])
+        has_next = len(items) > self.per_page
+        has_previous = forward is not None and bool(items)
+        return CursorPage(items[:self.per_page], self,
+                          has_previous, has_next)
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор, берущий число записей из готового счетчика.
+
+    count - функция, возвращающая поддерживаемое отдельно число записей
+    (счетчик в базе или в кеше, статистику таблицы). Если она задана,
+    собственный COUNT пагинатора не выполняется; насколько точно это
+    число, решает сама функция.
+    """
+
+    def __init__(self, object_list: QuerySet, per_page: int,
+                 count: Optional[Callable[[], int]] = None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self) -> int:
+        if self.known_count is not None:
+            return self.known_count()
+        return super().count
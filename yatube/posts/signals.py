@@ -0,0 +1,136 @@
+"""Обработчики сигналов моделей постов"""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts import counters, feed_cache, timeline
+from posts.models import Comment, Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, **kwargs):
+    """Создает нулевые счетчики нового пользователя.
+
+    Без записи первый же показ профиля пересчитывал бы счетчики.
+    """
+    if created:
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=instance.pk)], ignore_conflicts=True)
+
+
+# Поля пользователя, которые показываются в лентах.
+DISPLAYED_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def bump_user_feeds(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает кеш лент после изменения имени пользователя."""
+    if created:
+        return
+    if update_fields is not None and not (
+            DISPLAYED_USER_FIELDS & set(update_fields)):
+        return
+    feed_cache.bump_author_feeds(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    """Увеличивает счетчик постов автора."""
+    if created:
+        counters.increment(instance.author_id, 'post_count')
+        counters.adjust_total_posts(1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    """Уменьшает счетчик постов автора."""
+    counters.increment(instance.author_id, 'post_count', -1)
+    counters.adjust_total_posts(-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    """Увеличивает счетчики подписчиков и подписок."""
+    if created:
+        counters.increment(instance.author_id, 'follower_count')
+        counters.increment(instance.user_id, 'following_count')
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    """Уменьшает счетчики подписчиков и подписок."""
+    counters.increment(instance.author_id, 'follower_count', -1)
+    counters.increment(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """Заполняет ленту постами автора после подписки."""
+    if created:
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """Чистит ленту от постов автора после отписки."""
+    timeline.prune(instance.user, instance.author)
+
+
+@receiver(post_save, sender=Follow)
+def update_new_follow_fan_out(sender, instance, created, **kwargs):
+    """Перестраивает ленты, если автор стал популярным."""
+    if created:
+        timeline.followers_changed(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def update_deleted_follow_fan_out(sender, instance, **kwargs):
+    """Раскладывает посты автора, ставшего непопулярным."""
+    timeline.followers_changed(instance.author_id, -1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    """Запоминает прежнюю группу редактируемого поста."""
+    instance._old_group_id = None
+    if instance.pk:
+        instance._old_group_id = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def bump_saved_post_feeds(sender, instance, **kwargs):
+    """Сбрасывает кеш лент после создания или правки поста."""
+    feed_cache.bump_post_feeds(
+        instance,
+        [instance.group_id, getattr(instance, '_old_group_id', None)])
+
+
+@receiver(post_delete, sender=Post)
+def bump_deleted_post_feeds(sender, instance, **kwargs):
+    """Сбрасывает кеш лент после удаления поста."""
+    feed_cache.bump_post_feeds(instance, [instance.group_id])
+
+
+@receiver(post_save, sender=Comment)
+def bump_post_comments(sender, instance, created, **kwargs):
+    """Сбрасывает кеш комментариев поста."""
+    if created:
+        feed_cache.bump([feed_cache.post_feed(instance.post_id)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_feed(sender, instance, **kwargs):
+    """Сбрасывает кеш ленты подписок читателя."""
+    feed_cache.bump([feed_cache.follow_feed(instance.user_id)])
@@ -0,0 +1,22 @@
+from django import template
+from django.db.models.fields.files import ImageFieldFile
+
+from posts.thumbnails import cached_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image: ImageFieldFile) -> str:
+    """URL готовой миниатюры картинки поста.
+
+    Пока миниатюры нет, отдает URL оригинала: картинка никогда не
+    масштабируется во время запроса. Миниатюры создаются после
+    загрузки картинки и командой warm_thumbnails.
+    """
+    if not image:
+        return ''
+    thumbnail = cached_thumbnail(image)
+    if thumbnail is not None:
+        return thumbnail.url
+    return image.url
@@ -0,0 +1,44 @@
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+
+from posts import benchmark
+from posts.models import Post, TimelineEntry, UserCounters
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_scale(self):
+        """seed() создает данные заданного масштаба со всеми связями."""
+        scale = benchmark.seed(users=5, groups=2, posts=20, follows=2,
+                               comments=1, batch_size=8)
+        self.assertEqual(scale, {'users': 5, 'groups': 2, 'follows': 10,
+                                 'posts': 20, 'comments': 20})
+        self.assertEqual(Post.objects.count(), 20)
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertEqual(
+            sum(UserCounters.objects.values_list('post_count', flat=True)),
+            20)
+
+    def test_run_reports_percentiles(self):
+        """run() отдает перцентили и число запросов по сценариям."""
+        benchmark.seed(users=3, groups=1, posts=5, follows=1, comments=1)
+        results = benchmark.run(repeat=2, only=['index', 'post_create'])
+        self.assertEqual(set(results), {'index', 'post_create'})
+        self.assertEqual(set(results['index']),
+                         {'p50', 'p95', 'p99', 'queries'})
+
+    def test_measure_reads_streamed_response(self):
+        """Запросы потокового ответа при его чтении входят в замер."""
+        def request():
+            return StreamingHttpResponse(
+                str(Post.objects.count()) for _ in range(2))
+
+        self.assertEqual(benchmark.measure(request, 1)['queries'], 2)
+
+    def test_compare(self):
+        """Рост p95 сверх допуска и рост числа запросов - регрессии."""
+        baseline = {'index': {'p95': 10.0, 'queries': 3}}
+        self.assertEqual(benchmark.compare(
+            baseline, {'index': {'p95': 11.0, 'queries': 3}}), [])
+        self.assertEqual(len(benchmark.compare(
+            baseline, {'index': {'p95': 13.0, 'queries': 4}})), 2)
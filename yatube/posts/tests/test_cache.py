@@ -1,9 +1,14 @@
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from posts.models import Post
+from posts.models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -13,16 +18,170 @@ class CacheTests(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
         cls.post = Post.objects.create(
             author=User.objects.create_user(username='Author_cache'),
-            text='Тестовый текст cache')
+            text='Тестовый текст cache',
+            group=cls.group)
+
+    def setUp(self):
+        cache.clear()
 
     def test_index_page_cache(self):
         '''Проверка кеширования главной страницы.'''
         response1 = self.client.get(reverse('posts:index'))
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response2 = self.client.get(reverse('posts:index'))
         self.assertEqual(response1.content, response2.content)
         cache.clear()
         response3 = self.client.get(reverse('posts:index'))
         self.assertNotEqual(response1.content, response3.content)
+
+    def test_group_fragments_do_not_share_keys(self):
+        '''Фрагменты разных сообществ не смешиваются при равных версиях.'''
+        other = Group.objects.create(title='Другая', description='Текст',
+                                     slug='other-slug')
+        Post.objects.create(author=self.post.author, group=other,
+                            text='Пост другого сообщества')
+        with mock.patch('posts.feed_cache.time.time_ns', return_value=1):
+            self.client.get(reverse('posts:group_list',
+                                    args=[self.group.slug]))
+            response = self.client.get(reverse('posts:group_list',
+                                               args=[other.slug]))
+        self.assertContains(response, 'Пост другого сообщества')
+        self.assertNotContains(response, 'Тестовый текст cache')
+
+    def test_post_changes_invalidate_feeds(self):
+        '''Изменение поста сбрасывает кеш всех его лент.'''
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=self.post.author)
+        self.client.force_login(reader)
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author_cache'}),
+            reverse('posts:follow_index'),
+        ]
+        for address in addresses:
+            self.client.get(address)
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertContains(response, 'Исправленный текст')
+        self.post.delete()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertNotContains(response, 'Исправленный текст')
+
+    def test_user_changes_invalidate_feeds(self):
+        '''Смена имени автора сбрасывает кеш лент, вход - нет.'''
+        post = Post.objects.get(text='Тестовый текст cache')
+        author = post.author
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=author)
+        Comment.objects.create(post=post, author=author, text='Комментарий')
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author_cache'}),
+            reverse('posts:post_detail', kwargs={'post_id': post.id}),
+            reverse('posts:follow_index'),
+        ]
+        self.client.force_login(reader)
+        for address in addresses:
+            self.client.get(address)
+        index = self.client.get(addresses[0])
+        self.client.force_login(author)
+        self.client.force_login(reader)
+        self.assertEqual(self.client.get(addresses[0])['ETag'],
+                         index['ETag'])
+        author.first_name = 'Переименованный'
+        author.save()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertContains(response, 'Переименованный')
+
+    def test_comment_invalidates_post_page_only(self):
+        '''Новый комментарий сбрасывает кеш только страницы поста.'''
+        address = reverse('posts:post_detail',
+                          kwargs={'post_id': self.post.id})
+        index = self.client.get(reverse('posts:index'))
+        self.client.get(address)
+        Comment.objects.create(post=self.post, author=self.post.author,
+                               text='Свежий комментарий')
+        self.assertContains(self.client.get(address), 'Свежий комментарий')
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertEqual(self.client.get(reverse('posts:index')).content,
+                         index.content)
+
+    def test_conditional_get(self):
+        '''Неизмененная страница отдается ответом 304.'''
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author_cache'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                etag = response['ETag']
+                response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                response = self.client.get(
+                    address,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+        index_etag = self.client.get(addresses[0])['ETag']
+        with self.assertNumQueries(0):
+            self.client.get(addresses[0], HTTP_IF_NONE_MATCH=index_etag)
+        Comment.objects.create(post=self.post, author=self.post.author,
+                               text='Новый комментарий')
+        response = self.client.get(addresses[-1], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_depends_on_csrf_token(self):
+        '''ETag страницы с формой меняется вместе с CSRF-токеном.'''
+        address = reverse('posts:post_detail',
+                          kwargs={'post_id': self.post.id})
+        self.client.force_login(self.post.author)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        etag = self.client.get(address)['ETag']
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'b' * 32
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_object_looked_up_once(self):
+        '''Проверка ETag и view находят сообщество и пост одним запросом.'''
+        addresses = {
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}):
+                '"posts_group"."slug" =',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}):
+                '"posts_post"."id" =',
+        }
+        for address, lookup in addresses.items():
+            with self.subTest(address=address):
+                with CaptureQueriesContext(connection) as context:
+                    self.client.get(address)
+                self.assertEqual(len([
+                    query for query in context.captured_queries
+                    if lookup in query['sql']]), 1)
+
+    def test_conditional_get_depends_on_user(self):
+        '''ETag страницы зависит от пользователя.'''
+        address = reverse('posts:index')
+        etag = self.client.get(address)['ETag']
+        self.client.force_login(self.post.author)
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
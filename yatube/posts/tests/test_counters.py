@@ -0,0 +1,70 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from posts.models import Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+
+    def get_counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_new_user_has_counters(self):
+        """Счетчики нового пользователя создаются вместе с ним."""
+        user = User.objects.create_user(username='Newcomer')
+        counters = self.get_counters(user)
+        self.assertEqual((counters.post_count, counters.follower_count,
+                          counters.following_count), (0, 0, 0))
+
+    def test_post_counter(self):
+        """Создание и удаление поста меняют счетчик постов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Пост 2')
+        self.assertEqual(self.get_counters(self.author).post_count, 2)
+        post.delete()
+        self.assertEqual(self.get_counters(self.author).post_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счетчики обоих пользователей."""
+        Follow.objects.get_or_create(user=self.reader, author=self.author)
+        Follow.objects.get_or_create(user=self.reader, author=self.author)
+        self.assertEqual(self.get_counters(self.author).follower_count, 1)
+        self.assertEqual(self.get_counters(self.reader).following_count, 1)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.get_counters(self.author).follower_count, 0)
+        self.assertEqual(self.get_counters(self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет расхождения счетчиков."""
+        Post.objects.create(author=self.author, text='Пост')
+        UserCounters.objects.filter(user=self.author).update(post_count=7)
+        UserCounters.objects.filter(user=self.reader).delete()
+        call_command('recount', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.get_counters(self.author).post_count, 1)
+        self.assertEqual(self.get_counters(self.reader).post_count, 0)
+
+
+class CountersTransactionTests(TransactionTestCase):
+
+    def test_counter_saved_with_post(self):
+        """Пост и его счетчик сохраняются одной транзакцией."""
+        author = User.objects.create_user(username='Author')
+        with mock.patch('posts.counters.increment',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Post.objects.create(author=author, text='Пост')
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(
+            UserCounters.objects.get(user=author).post_count, 0)
@@ -0,0 +1,95 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.admin = User.objects.create_user(username='Admin',
+                                             is_staff=True)
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост в группе')
+        Post.objects.create(author=cls.reader, text='Пост без группы')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+
+    def test_command_ndjson(self):
+        """Команда пишет по одному посту на строку с учетом фильтров."""
+        out = io.StringIO()
+        call_command('export_posts', 'posts', group='group', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], self.post.text)
+        self.assertEqual(rows[0]['author__username'], 'Author')
+
+    def test_command_gzip_csv_file(self):
+        """Команда сжимает CSV в файл."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'comments.csv.gz')
+            call_command('export_posts', 'comments', format='csv',
+                         gzip=True, output=path, stderr=io.StringIO())
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], 'Комментарий')
+
+    def test_date_filter(self):
+        """Фильтр по датам отсекает посты вне диапазона."""
+        out = io.StringIO()
+        call_command('export_posts', 'posts',
+                     since=(timezone.now() + timedelta(days=1)).isoformat(),
+                     stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_view_streams_gzip(self):
+        """View отдает сжатую выгрузку потоком."""
+        response = self.admin_client.get(
+            reverse('posts:export', args=['follows']), {'gzip': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        row = json.loads(content)
+        self.assertEqual(row['user__username'], 'Reader')
+
+    def test_view_rejects_bad_request(self):
+        """Неизвестный формат и неверная дата дают 400."""
+        url = reverse('posts:export', args=['posts'])
+        self.assertEqual(
+            self.admin_client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(
+            self.admin_client.get(url, {'since': 'вчера'}).status_code, 400)
+        self.assertEqual(self.admin_client.get(
+            url, {'until': '2020-02-30T00:00'}).status_code, 400)
+
+    def test_view_staff_only(self):
+        """Выгрузка недоступна обычным пользователям."""
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:export', args=['posts']))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as django_timezone
+
+from posts.importer import bulk_insert
+from posts.models import Follow, Group, Post, TimelineEntry, UserCounters
+from search.backends import get_backend
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportPostsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def import_rows(self, rows, *args):
+        path = os.path.join(self.directory, 'posts.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            for row in rows:
+                if not isinstance(row, str):
+                    row = json.dumps(row, ensure_ascii=False)
+                file.write(row + '\n')
+        out = io.StringIO()
+        call_command('import_posts', path, *args,
+                     stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_import_preserves_pub_date(self):
+        """Импорт вставляет посты пачками с исходной датой."""
+        self.import_rows([
+            {'author': 'Author', 'group': 'group', 'text': f'Пост {i}',
+             'pub_date': f'2015-01-0{i + 1}T10:00:00+00:00'}
+            for i in range(3)
+        ] + [{'author': 'Nobody', 'text': 'Без автора'}], '--batch-size=2')
+        posts = Post.objects.filter(author=self.author).order_by('pub_date')
+        self.assertEqual(posts.count(), 3)
+        self.assertEqual(posts[0].pub_date.year, 2015)
+        self.assertEqual(posts[0].group, self.group)
+        self.assertFalse(Post.objects.filter(text='Без автора').exists())
+
+    def test_bulk_insert_keeps_field_and_ids(self):
+        """Вставка не трогает auto_now_add и узнает id своих постов."""
+        Post.objects.create(author=self.author, text='Уже был')
+        pub_date = datetime(2015, 1, 1, tzinfo=timezone.utc)
+        posts = bulk_insert([
+            Post(author=self.author, text=f'Пост {i}', pub_date=pub_date)
+            for i in range(3)
+        ])
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        for post in posts:
+            saved = Post.objects.get(pk=post.pk)
+            self.assertEqual(saved.text, post.text)
+            self.assertEqual(saved.pub_date, pub_date)
+
+    def test_bulk_insert_writes_posts_once(self):
+        """Посты вставляются одним INSERT, без UPDATE дат."""
+        with CaptureQueriesContext(connection) as context:
+            bulk_insert([Post(author=self.author, text=f'Пост {i}',
+                              pub_date=django_timezone.now())
+                         for i in range(3)])
+        writes = [query['sql'] for query in context.captured_queries
+                  if query['sql'].startswith(('INSERT INTO "posts_post"',
+                                              'UPDATE "posts_post"'))]
+        self.assertEqual(len(writes), 1)
+
+    def test_malformed_lines_are_skipped(self):
+        """Битый JSON и не объекты пропускаются, импорт продолжается."""
+        out = self.import_rows([
+            '{"author": "Author", "text": "Первый"',
+            '["Author", "Массив"]',
+            {'author': 'Author', 'text': 'Целый'},
+        ])
+        self.assertTrue(Post.objects.filter(text='Целый').exists())
+        self.assertIn('пропущено строк: 2', out)
+
+    def test_import_updates_derived_data(self):
+        """Импорт обновляет счетчики, ленты и поисковый индекс."""
+        self.import_rows([{'author__username': 'Author',
+                           'text': 'Импортированный пост'}])
+        post = Post.objects.get(text='Импортированный пост')
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).post_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(get_backend().search('импортированный', 10),
+                         [post.id])
+
+    def test_import_images_and_missing(self):
+        """Картинки копируются из каталога, авторы создаются по флагу."""
+        with open(os.path.join(self.directory, 'pic.gif'), 'wb') as file:
+            file.write(b'GIF89a')
+        self.import_rows([{'author': 'Newcomer', 'text': 'С картинкой',
+                           'image': 'posts/pic.gif'}],
+                         '--images', self.directory, '--create-missing')
+        post = Post.objects.get(text='С картинкой')
+        self.assertEqual(post.author.username, 'Newcomer')
+        self.assertTrue(post.image.name.startswith('posts/pic'))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_image_outside_directory_is_rejected(self):
+        """Картинки вне каталога не читаются, строки пропускаются."""
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside, ignore_errors=True)
+        secret = os.path.join(outside, 'secret.gif')
+        with open(secret, 'wb') as file:
+            file.write(b'GIF89a')
+        os.symlink(secret, os.path.join(self.directory, 'link.gif'))
+        names = [secret, f'../{os.path.basename(outside)}/secret.gif',
+                 'link.gif']
+        out = self.import_rows(
+            [{'author': 'Author', 'text': f'Картинка {name}', 'image': name}
+             for name in names], '--images', self.directory)
+        self.assertIn('пропущено строк: 3', out)
+        self.assertFalse(Post.objects.filter(
+            text__startswith='Картинка').exists())
@@ -0,0 +1,68 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import encode_cursor
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый текст')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Тестовый комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def get_plans(self, address):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(address)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if 'posts_' not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans[query['sql']] = [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def test_views_use_indexes_without_temp_sort(self):
+        """Запросы страниц идут по индексам и без сортировки во временном
+        B-дереве."""
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:index') + f'?before={encode_cursor(self.post)}',
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': f'{self.post.id}'}),
+            reverse('posts:follow_index'),
+        ]
+        for address in addresses:
+            for sql, plan in self.get_plans(address).items():
+                with self.subTest(address=address, sql=sql):
+                    for step in plan:
+                        self.assertIsNone(FULL_SCAN.match(step), plan)
+                        self.assertNotIn(TEMP_SORT, step, plan)
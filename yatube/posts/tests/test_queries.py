@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.tests.utils import QueryCountMixin
+
+User = get_user_model()
+
+
+class FeedQueriesTests(QueryCountMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        for i in range(6):
+            author = User.objects.create_user(username=f'Author{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(author=author, group=cls.group,
+                                text=f'Тестовый текст{i}')
+        author = User.objects.get(username='Author0')
+        for i in range(5):
+            Post.objects.create(author=author, group=cls.group,
+                                text=f'Тестовый текст автора{i}')
+        cls.post = Post.objects.first()
+        for author in User.objects.all():
+            Comment.objects.create(post=cls.post, author=author,
+                                   text='Тестовый комментарий')
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_feed_query_count_does_not_grow_with_page_size(self):
+        """Число запросов ленты не растет с числом постов на странице."""
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author0'}),
+            reverse('posts:follow_index'),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                self.assertQueryCountConstant(address)
+
+    def test_comments_query_count_does_not_grow_with_page_size(self):
+        """Число запросов страницы поста не растет с числом
+        комментариев на странице."""
+        addresses = [
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:comment_list', kwargs={'post_id': self.post.id}),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                self.assertQueryCountConstant(address,
+                                              setting='COMMENTS_PER_PAGE')
@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+
+from posts.feed_cache import feed_version, post_feed
+from posts.models import Post
+from posts.thumbnails import cached_thumbnail, generate_thumbnail
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='Author'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name='thumb.gif', content=small_gif,
+                                     content_type='image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def render(self, posts=None):
+        template = Template(
+            '{% load post_thumbnails %}{% for post in posts %}'
+            '{% thumbnail_url post.image as url %}{{ url }}{% endfor %}'
+        )
+        return template.render(Context({'posts': posts or [self.post]}))
+
+    def test_tag_falls_back_to_original(self):
+        """Без готовой миниатюры тег отдает оригинал, не масштабируя."""
+        self.assertIsNone(cached_thumbnail(self.post.image))
+        self.assertEqual(self.render(), self.post.image.url)
+        self.assertIsNone(cached_thumbnail(self.post.image))
+
+    def test_tag_uses_generated_thumbnail(self):
+        """После генерации тег отдает адрес миниатюры."""
+        self.assertTrue(generate_thumbnail(self.post.image.name))
+        thumbnail = cached_thumbnail(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual(self.render(), thumbnail.url)
+
+    def test_lookups_are_cached(self):
+        """Повторный рендер постов с картинками не ходит в базу sorl."""
+        posts = [self.post] + [
+            Post.objects.create(author=self.post.author, text='Копия',
+                                image=self.post.image.name)
+            for _ in range(3)
+        ]
+        self.assertTrue(generate_thumbnail(self.post.image.name))
+        other = Post.objects.create(
+            author=self.post.author, text='Без миниатюры',
+            image=SimpleUploadedFile(name='other.gif',
+                                     content=self.post.image.read(),
+                                     content_type='image/gif'))
+        posts.append(other)
+        self.render(posts)
+        with self.assertNumQueries(0):
+            content = self.render(posts)
+        self.assertIn(cached_thumbnail(self.post.image).url, content)
+        self.assertIn(other.image.url, content)
+
+    def test_generated_thumbnail_refreshes_feeds(self):
+        """Готовая миниатюра сбрасывает кеш лент с постом."""
+        version = feed_version(post_feed(self.post.id))
+        self.assertTrue(generate_thumbnail(self.post.image.name))
+        self.assertNotEqual(feed_version(post_feed(self.post.id)), version)
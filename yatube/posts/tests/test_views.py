@@ -4,11 +4,17 @@ import tempfile
 from django import forms
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Group, Post, Follow
+from core.templatetags.user_filters import page_window
+from posts.counters import recount
+
+from posts.models import Comment, Group, Post, Follow
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -283,6 +289,7 @@ class PaginatorViewsTest(TestCase):
                               text=f'Тестовый текст{i}',
                               group=cls.group))
         Post.objects.bulk_create(posts)
+        recount([author.id])
 
     def setUp(self):
         self.user = User.objects.create_user(username='HasNoName')
@@ -312,3 +319,121 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(reverse_list=reverse_list):
                 response = self.client.get(reverse_list + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
+
+
+@override_settings(POSTS_PER_PAGE=1)
+class ApproximateCountPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Тестовый текст{i}')
+            for i in range(25)
+        )
+        recount([cls.author.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_index(self, page):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'),
+                                       {'page': page})
+        counts = [query for query in context.captured_queries
+                  if 'COUNT(' in query['sql']]
+        return response.context['page_obj'], counts
+
+    def test_index_count_from_cached_total(self):
+        """Главная берет число постов из счетчика, COUNT - один на промах."""
+        page_obj, counts = self.get_index(1)
+        self.assertEqual(page_obj.paginator.count, 25)
+        self.assertEqual(len(counts), 1)
+        Post.objects.create(author=self.author, text='Новый пост')
+        page_obj, counts = self.get_index(1)
+        self.assertEqual(page_obj.paginator.count, 26)
+        self.assertEqual(counts, [])
+
+    def test_profile_count_from_counters(self):
+        """Профиль берет число постов из счетчиков пользователя."""
+        self.client.get(reverse('posts:profile', args=['Author']))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('posts:profile', args=['Author']))
+        self.assertEqual(response.context['page_obj'].paginator.count, 25)
+        self.assertFalse([query for query in context.captured_queries
+                          if 'COUNT(' in query['sql']])
+
+    def test_page_window(self):
+        """Ссылки на страницы - окно вокруг текущей, первая и последняя."""
+        page_obj, _ = self.get_index(13)
+        self.assertEqual(page_window(page_obj),
+                         [1, None, 11, 12, 13, 14, 15, None, 25])
+        page_obj, _ = self.get_index(2)
+        self.assertEqual(page_window(page_obj), [1, 2, 3, 4, None, 25])
+
+
+class CursorPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='Author')
+        posts: list = []
+        for i in range(13):
+            posts.append(Post(author=author, text=f'Тестовый текст{i}'))
+        Post.objects.bulk_create(posts)
+
+    def test_cursor_pages_cover_feed(self):
+        """Курсорные страницы ?before=/?after= обходят ленту без пропусков."""
+        response = self.client.get(reverse('posts:index') + '?before=x')
+        first_page = response.context['page_obj']
+        self.assertTrue(first_page.is_cursor)
+        self.assertEqual(len(first_page), 10)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        response = self.client.get(
+            reverse('posts:index') + f'?before={first_page.next_cursor()}')
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            list(first_page) + list(second_page),
+            list(Post.objects.order_by('-pub_date', '-id'))
+        )
+        response = self.client.get(
+            reverse('posts:index')
+            + f'?after={second_page.previous_cursor()}')
+        self.assertEqual(list(response.context['page_obj']),
+                         list(first_page))
+
+
+class CommentPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='Author')
+        cls.post = Post.objects.create(author=author, text='Тестовый текст')
+        for i in range(5):
+            Comment.objects.create(post=cls.post, author=author,
+                                   text=f'Комментарий{i}')
+
+    @override_settings(COMMENTS_PER_PAGE=3)
+    def test_post_detail_and_json_comment_pages(self):
+        """Комментарии отдаются порциями от старых к новым."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual([comment.text for comment in comments],
+                         ['Комментарий0', 'Комментарий1', 'Комментарий2'])
+        self.assertTrue(comments.has_next())
+        response = self.client.get(
+            reverse('posts:comment_list', kwargs={'post_id': self.post.id}),
+            {'after': comments.next_cursor()})
+        data = response.json()
+        self.assertEqual([comment['text'] for comment in data['comments']],
+                         ['Комментарий3', 'Комментарий4'])
+        self.assertEqual(data['comments'][0]['author'], 'Author')
+        self.assertIsNone(data['next'])
@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin:
+    """Проверки числа SQL-запросов страницы."""
+
+    def count_queries(self, address, per_page, setting='POSTS_PER_PAGE'):
+        cache.clear()
+        with override_settings(**{setting: per_page}):
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(address)
+        return len(context)
+
+    def assertQueryCountConstant(self, address, small=1, large=5,
+                                 setting='POSTS_PER_PAGE'):
+        """Число запросов страницы не зависит от размера страницы."""
+        small_count = self.count_queries(address, small, setting)
+        large_count = self.count_queries(address, large, setting)
+        self.assertEqual(
+            small_count, large_count,
+            f'{address}: {small_count} запросов при {setting}={small} '
+            f'и {large_count} при {setting}={large}'
+        )
@@ -0,0 +1,149 @@
+"""Предварительная генерация миниатюр картинок постов.
+
+Миниатюры создаются в фоне сразу после загрузки картинки, а шаблоны
+только ищут готовую миниатюру в хранилище sorl и никогда не
+масштабируют картинку во время запроса. Пока миниатюры нет, в
+кешированные фрагменты лент попадает оригинал, поэтому готовая
+миниатюра сбрасывает версии лент с постами этой картинки.
+
+Результат поиска миниатюры, в том числе ее отсутствие, хранится в кеше
+THUMBNAIL_LOOKUP_TTL секунд, иначе каждый пост с картинкой стоил бы
+запроса к хранилищу sorl при каждом рендере ленты. Готовая миниатюра
+сразу записывается в этот кеш.
+"""
+
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.functional import empty
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.feed_cache import bump_post_feeds
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+LOOKUP_KEY = 'thumbnail:{}'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Set[str] = set()
+_pending_lock = threading.Lock()
+
+
+class CachedThumbnailBackend(ThumbnailBackend):
+    """Backend sorl, который умеет только искать готовые миниатюры."""
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Возвращает миниатюру из хранилища sorl или None."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def lookup_key(name: str) -> str:
+    return LOOKUP_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def cached_thumbnail(image) -> Optional[ImageFile]:
+    """Готовая миниатюра картинки поста или None."""
+    if not image:
+        return None
+    key = lookup_key(image.name)
+    name = cache.get(key)
+    if name is None:
+        thumbnail = CachedThumbnailBackend().get_cached_thumbnail(
+            image, GEOMETRY, **OPTIONS)
+        # Пустая строка - миниатюры нет.
+        name = '' if thumbnail is None else thumbnail.name
+        cache.set(key, name, settings.THUMBNAIL_LOOKUP_TTL)
+    if not name:
+        return None
+    return ImageFile(name, default.storage)
+
+
+def generate_thumbnail(name: str) -> bool:
+    """Создает миниатюру картинки; возвращает успех."""
+    try:
+        thumbnail = get_thumbnail(name, GEOMETRY, **OPTIONS)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', name)
+        return False
+    cache.set(lookup_key(name), thumbnail.name,
+              settings.THUMBNAIL_LOOKUP_TTL)
+    refresh_post_feeds(name)
+    return True
+
+
+def refresh_post_feeds(name: str) -> None:
+    """Сбрасывает кеш лент с постами картинки name."""
+    posts = Post.objects.filter(image=name).only('id', 'author_id',
+                                                 'group_id')
+    for post in posts:
+        bump_post_feeds(post, [post.group_id])
+
+
+def _generate_in_worker(name: str) -> None:
+    try:
+        generate_thumbnail(name)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+        connection.close()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def queue_thumbnail(name: str) -> None:
+    """Ставит создание миниатюры в очередь после коммита транзакции."""
+    if not settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: generate_thumbnail(name))
+        return
+
+    def submit():
+        with _pending_lock:
+            if name in _pending:
+                return
+            _pending.add(name)
+        get_executor().submit(_generate_in_worker, name)
+
+    transaction.on_commit(submit)
+
+
+@receiver(setting_changed)
+def reset_thumbnail_storage(setting, **kwargs):
+    """Сбрасывает хранилище sorl при смене MEDIA_ROOT.
+
+    В отличие от default_storage, оно само не следит за настройкой.
+    """
+    if setting in ('MEDIA_ROOT', 'MEDIA_URL'):
+        default.storage._wrapped = empty
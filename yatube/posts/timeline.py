@@ -0,0 +1,128 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост автора сразу раскладывается по лентам его подписчиков,
+поэтому чтение ленты - это выборка по индексу (user, pub_date).
+Посты авторов с числом подписчиков от TIMELINE_CELEBRITY_FOLLOWERS
+не раскладываются, а подмешиваются при чтении (fan-out on read).
+Когда автор пересекает этот порог, его посты убираются из лент
+подписчиков или раскладываются по ним заново.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q, QuerySet
+
+from posts.models import Follow, Post, TimelineEntry, UserCounters
+
+User = get_user_model()
+
+
+def is_celebrity(author: User) -> bool:
+    """Слишком много подписчиков для раскладки постов по лентам."""
+    followers = UserCounters.objects.filter(user=author).values_list(
+        'follower_count', flat=True).first() or 0
+    return followers >= settings.TIMELINE_CELEBRITY_FOLLOWERS
+
+
+def celebrity_follows(user: User) -> QuerySet:
+    """Подписки пользователя на авторов, чьи посты читаются напрямую."""
+    return Follow.objects.filter(
+        user=user,
+        author__counters__follower_count__gte=(
+            settings.TIMELINE_CELEBRITY_FOLLOWERS)
+    ).values('author')
+
+
+def timeline_posts(user: User) -> QuerySet:
+    """Посты ленты подписок пользователя.
+
+    Без подписок на популярных авторов лента читается одним проходом
+    по индексу (user, pub_date) таблицы TimelineEntry.
+    """
+    celebrities = celebrity_follows(user)
+    if not celebrities.exists():
+        return Post.objects.filter(timeline_entries__user=user).order_by(
+            '-timeline_entries__pub_date')
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author__in=celebrities)
+    )
+
+
+def _push(readers: Iterable[int], posts: Iterable[Post]) -> None:
+    entries = [
+        TimelineEntry(user_id=reader, post_id=post.id,
+                      pub_date=post.pub_date)
+        for reader in readers
+        for post in posts
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def fan_out_post(post: Post) -> None:
+    """Добавляет новый пост в ленты подписчиков автора."""
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts: Iterable[Post]) -> None:
+    """Добавляет новые посты в ленты подписчиков их авторов."""
+    by_author: Dict[int, List[Post]] = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    celebrities = set(UserCounters.objects.filter(
+        user__in=by_author,
+        follower_count__gte=settings.TIMELINE_CELEBRITY_FOLLOWERS
+    ).values_list('user', flat=True))
+    for author_id, author_posts in by_author.items():
+        if author_id in celebrities:
+            continue
+        readers = Follow.objects.filter(
+            author=author_id).values_list('user', flat=True)
+        _push(readers.iterator(), author_posts)
+
+
+def backfill(user: User, author: User) -> None:
+    """Добавляет в ленту пользователя посты нового автора."""
+    if is_celebrity(author):
+        return
+    posts = Post.objects.filter(author=author).only('id', 'pub_date')
+    _push([user.id], posts.iterator())
+
+
+def followers_changed(author_id: int, delta: int) -> None:
+    """Переводит автора между раскладкой при записи и при чтении.
+
+    Вызывается после изменения числа подписчиков автора на delta.
+    """
+    threshold = settings.TIMELINE_CELEBRITY_FOLLOWERS
+    followers = UserCounters.objects.filter(user=author_id).values_list(
+        'follower_count', flat=True).first() or 0
+    before = followers - delta
+    if before < threshold <= followers:
+        TimelineEntry.objects.filter(post__author=author_id).delete()
+    elif followers < threshold <= before:
+        posts = list(Post.objects.filter(author=author_id).only(
+            'id', 'pub_date'))
+        readers = Follow.objects.filter(
+            author=author_id).values_list('user', flat=True)
+        for reader in readers.iterator():
+            _push([reader], posts)
+
+
+def prune(user: User, author: User) -> None:
+    """Убирает из ленты пользователя посты автора."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def rebuild(user: User) -> None:
+    """Пересобирает ленту пользователя с нуля."""
+    TimelineEntry.objects.filter(user=user).delete()
+    for follow in Follow.objects.filter(user=user).select_related('author'):
+        backfill(user, follow.author)
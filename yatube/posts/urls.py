@@ -15,6 +15,14 @@ urlpatterns = [
         'posts/<int:post_id>/comment/',
         views.add_comment, name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comment_list, name='comment_list'
+    ),
+    path(
+        'export/<str:kind>/',
+        views.export_data, name='export'
+    ),
     path(
         'follow/', views.follow_index,
         name='follow_index'
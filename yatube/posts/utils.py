@@ -0,0 +1,43 @@
+"""Вспомогательные функции для views"""
+
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.paginator import Page
+from django.db.models import QuerySet
+from django.http import HttpRequest
+
+from posts.models import Post
+from posts.paginators import (ApproximateCountPaginator, CursorPage,
+                              CursorPaginator)
+
+
+def paginate(request: HttpRequest, post_list: QuerySet,
+             count: Optional[Callable[[], int]] = None) -> Page:
+    """Возвращает страницу ленты постов.
+
+    При наличии ?before=/?after= (или включенной настройке
+    POSTS_CURSOR_PAGINATION) используется курсорная пагинация,
+    иначе - обычная постраничная по ?page=. count - готовое число
+    постов вместо COUNT, см. ApproximateCountPaginator.
+    """
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if before or after or settings.POSTS_CURSOR_PAGINATION:
+        paginator = CursorPaginator(post_list, settings.POSTS_PER_PAGE,
+                                    before=before, after=after)
+        return paginator.page()
+    paginator = ApproximateCountPaginator(post_list, settings.POSTS_PER_PAGE,
+                                          count=count)
+    page_number = request.GET.get('page')
+    return paginator.get_page(page_number)
+
+
+def paginate_comments(request: HttpRequest, post: Post) -> CursorPage:
+    """Возвращает страницу комментариев поста, от старых к новым."""
+    comments = post.comments.select_related('author')
+    paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE,
+                                before=request.GET.get('before'),
+                                after=request.GET.get('after'),
+                                newest_first=False)
+    return paginator.page()
@@ -1,61 +1,115 @@
 """Настройка views функций"""
 
-from django.core.paginator import Paginator
+from typing import List, Optional
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, HttpRequest
+from django.http import (Http404, HttpResponse, HttpRequest,
+                         HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
 
-from django.conf import settings
+from core.db.replicas import use_replica
+from core.streaming import stream_render
 from posts.models import Post, Group, Follow
+from posts.counters import get_counters, total_posts
+from posts.export import CONTENT_TYPES, ExportError, export
+from posts.feed_cache import (conditional_feed, feed_cache_context,
+                              follow_feed, group_feed, index_feed, post_feed,
+                              profile_feed)
 from posts.forms import PostForm, CommentForm
+from posts.thumbnails import queue_thumbnail
+from posts.timeline import timeline_posts
+from posts.utils import paginate, paginate_comments
+from users.lookup import get_user_by_username, get_user_or_404
+
+
+def _group(request: HttpRequest, slug: str) -> Optional[Group]:
+    """Сообщество страницы, один запрос к базе на запрос к сайту."""
+    if not hasattr(request, '_page_group'):
+        request._page_group = Group.objects.filter(slug=slug).first()
+    return request._page_group
+
+
+def _post(request: HttpRequest, post_id: int) -> Optional[Post]:
+    """Пост страницы, один запрос к базе на запрос к сайту."""
+    if not hasattr(request, '_page_post'):
+        request._page_post = Post.objects.for_feed().filter(id=post_id).first()
+    return request._page_post
 
 
-User = get_user_model()
+def _group_feeds(request: HttpRequest, slug: str) -> Optional[List[str]]:
+    group = _group(request, slug)
+    return None if group is None else [group_feed(group.id)]
 
 
+def _profile_feeds(request: HttpRequest,
+                   username: str) -> Optional[List[str]]:
+    author = get_user_by_username(username)
+    if author is None:
+        return None
+    feeds = [profile_feed(author.id)]
+    if request.user.is_authenticated:
+        feeds.append(follow_feed(request.user.id))
+    return feeds
+
+
+def _post_feeds(request: HttpRequest, post_id: int) -> Optional[List[str]]:
+    post = _post(request, post_id)
+    if post is None:
+        return None
+    return [post_feed(post_id), profile_feed(post.author_id)]
+
+
+@use_replica
+@conditional_feed(lambda request: [index_feed()])
 def index(request: HttpRequest) -> HttpResponse:
     """Рендер главной страницы."""
     template = 'posts/index.html'
     text: str = 'Последние обновления на сайте.'
-    post_list = Post.objects.select_related('group').all()
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    page_obj = paginate(request, post_list, count=total_posts)
     context = {
         'text': text,
         'page_obj': page_obj,
+        **feed_cache_context(index_feed()),
     }
     return render(request, template, context)
 
 
+@use_replica
+@conditional_feed(_group_feeds)
 def group_list(request: HttpRequest, slug: str) -> HttpResponse:
     """Рендер страницы сообщества."""
     template = 'posts/group_list.html'
     text: str = f'Записи сообщества: {slug}'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = _group(request, slug)
+    if group is None:
+        raise Http404(f'Сообщество {slug} не найдено.')
+    post_list = group.posts.for_feed()
+    page_obj = paginate(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj,
         'text': text,
+        **feed_cache_context(group_feed(group.id)),
     }
     return render(request, template, context)
 
 
+@use_replica
+@conditional_feed(_profile_feeds)
 def profile(request: HttpRequest, username: str) -> HttpResponse:
     """Рендер страницы пользователя."""
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = get_user_or_404(username)
+    post_list = author.posts.for_feed()
     text: str = f'Профайл пользователя {author.get_full_name()}'
-    quantity = post_list.count()
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    quantity = get_counters(author).post_count
+    page_obj = paginate(request, post_list, count=lambda: quantity)
     if request.user.is_anonymous:
         following = False
     else:
@@ -66,28 +120,37 @@ def profile(request: HttpRequest, username: str) -> HttpResponse:
         'text': text,
         'quantity': quantity,
         'author': author,
-        'following': following
+        'following': following,
+        **feed_cache_context(profile_feed(author.id)),
     }
-    return render(request, template, context)
+    return stream_render(request, template, context)
 
 
+@use_replica
+@conditional_feed(_post_feeds, forms=True)
 def post_detail(request: HttpRequest, post_id: int) -> HttpResponse:
     """Рендер страницы поста."""
     template = 'posts/post_detail.html'
-    single_post = get_object_or_404(Post, id=post_id)
+    single_post = _post(request, post_id)
+    if single_post is None:
+        raise Http404(f'Пост {post_id} не найден.')
     text: str = f'{single_post.text}'[:30]
     single_post_author = single_post.author
-    quantity = Post.objects.filter(author=single_post_author).count()
+    quantity = get_counters(single_post_author).post_count
     form = CommentForm(request.POST or None)
-    comments = single_post.comments.all()
+    comments = SimpleLazyObject(
+        lambda: paginate_comments(request, single_post))
     context = {
         'post': single_post,
         'text': text,
         'quantity': quantity,
         'form': form,
         'comments': comments,
+        **feed_cache_context(post_feed(single_post.id)),
     }
-    return render(request, template, context)
+    # Форма комментария есть только у вошедших.
+    return stream_render(request, template, context,
+                         csrf=request.user.is_authenticated)
 
 
 @login_required
@@ -102,6 +165,8 @@ def post_create(request: HttpRequest) -> HttpResponse:
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    if post.image:
+        queue_thumbnail(post.image.name)
     return redirect('post:profile', username=request.user)
 
 
@@ -127,6 +192,8 @@ def post_edit(request: HttpRequest, post_id: int) -> HttpResponse:
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    if 'image' in form.changed_data and post.image:
+        queue_thumbnail(post.image.name)
     return redirect('post:post_detail', post_id=post.id)
 
 
@@ -144,19 +211,41 @@ def add_comment(request: HttpRequest, post_id: int) -> HttpResponse:
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@use_replica
+def comment_list(request: HttpRequest, post_id: int) -> JsonResponse:
+    """Следующая порция комментариев поста в JSON."""
+    post = get_object_or_404(Post, pk=post_id)
+    comments = paginate_comments(request, post)
+    return JsonResponse({
+        'comments': [
+            {
+                'id': comment.id,
+                'author': comment.author.username,
+                'author_url': reverse('posts:profile',
+                                      args=[comment.author.username]),
+                'text': comment.text,
+                'pub_date': comment.pub_date.isoformat(),
+            }
+            for comment in comments
+        ],
+        'next': comments.next_cursor(),
+    })
+
+
 @login_required
+@use_replica
 def follow_index(request: HttpRequest) -> HttpResponse:
     '''Рендер страницы с постами отслеживаемых авторов.'''
     template = 'posts/follow.html'
     text: str = f'Подписки пользователя {request.user}'
     user = request.user
-    post_list = Post.objects.filter(author__following__user=user)
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = timeline_posts(user).for_feed()
+    page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
-        'text': text}
+        'text': text,
+        **feed_cache_context(follow_feed(user.id)),
+    }
     return render(request, template, context)
 
 
@@ -164,7 +253,7 @@ def follow_index(request: HttpRequest) -> HttpResponse:
 def profile_follow(request: HttpRequest, username: str) -> HttpResponse:
     '''Добавление подписки.'''
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     if request.user != author:
         Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:follow_index')
@@ -174,6 +263,37 @@ def profile_follow(request: HttpRequest, username: str) -> HttpResponse:
 def profile_unfollow(request: HttpRequest, username: str) -> HttpResponse:
     '''Отмена подписки.'''
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:follow_index')
+
+
+@staff_member_required
+def export_data(request: HttpRequest, kind: str) -> HttpResponse:
+    '''Потоковая выгрузка постов, комментариев или подписок.'''
+    fmt = request.GET.get('format', 'ndjson')
+    compress = request.GET.get('gzip') == '1'
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_datetime(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return HttpResponseBadRequest(f'Неверная дата: {name}')
+    try:
+        chunks = export(kind, fmt, compress,
+                        author=request.GET.get('author'),
+                        group=request.GET.get('group'), **dates)
+    except ExportError as error:
+        return HttpResponseBadRequest(str(error))
+    filename = f'{kind}.{fmt}'
+    if compress:
+        content_type = 'application/gzip'
+        filename += '.gz'
+    else:
+        content_type = f'{CONTENT_TYPES[fmt]}; charset=utf-8'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
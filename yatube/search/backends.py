@@ -0,0 +1,192 @@
+"""Поисковые индексы по тексту постов и названию группы.
+
+Основной индекс - виртуальная таблица SQLite FTS5 с ранжированием
+bm25. Если FTS5 недоступен (другая СУБД или SQLite без расширения),
+используется обратный индекс в таблице SearchTerm.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (Count, FloatField, OuterRef, QuerySet, Subquery,
+                              Sum)
+from django.db.models.expressions import RawSQL
+
+from posts.models import Post
+from search.models import SearchTerm
+
+FTS_TABLE = 'search_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+GROUP_TITLE_WEIGHT = 3
+
+_fts_available: Dict[str, bool] = {}
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова в нижнем регистре."""
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def fts_available() -> bool:
+    """Есть ли в текущей базе таблица FTS5."""
+    name = connection.settings_dict['NAME']
+    if name not in _fts_available:
+        _fts_available[name] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[name]
+
+
+def _group_title(post: Post) -> str:
+    return post.group.title if post.group_id else ''
+
+
+def fts_row(post: Post) -> Tuple[int, str, str]:
+    """Строка таблицы FTS5 с нормализованным текстом поста."""
+    return (post.id, ' '.join(tokenize(post.text)),
+            ' '.join(tokenize(_group_title(post))))
+
+
+def post_weights(post: Post) -> Counter:
+    """Веса слов поста для обратного индекса."""
+    weights = Counter(tokenize(post.text))
+    for term in tokenize(_group_title(post)):
+        weights[term] += GROUP_TITLE_WEIGHT
+    return weights
+
+
+def fts_match(query: str) -> Optional[str]:
+    """Выражение MATCH для запроса; последнее слово - префикс."""
+    terms = tokenize(query)
+    if not terms:
+        return None
+    match = ' '.join(f'"{term}"' for term in terms[:-1])
+    return f'{match} "{terms[-1]}"*'.strip()
+
+
+class MatchedRowids(RawSQL):
+    """Подзапрос rowid для id__in.
+
+    Lookup in сам берет правую часть в скобки, а вторые скобки от
+    RawSQL превращают подзапрос в SQLite в скалярное значение.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class FTS5Backend:
+    """Поиск через SQLite FTS5."""
+
+    def index_posts(self, posts: Iterable[Post]) -> None:
+        rows = [fts_row(post) for post in posts]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text, group_title) '
+                f'VALUES (%s, %s, %s)',
+                rows
+            )
+
+    def remove_post(self, post_id: int) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+
+    def clear(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query: str, limit: int) -> List[int]:
+        match = fts_match(query)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 1.0, {GROUP_TITLE_WEIGHT}.0) '
+                f'LIMIT %s',
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_queryset(self, queryset: QuerySet, query: str) -> QuerySet:
+        match = fts_match(query)
+        if match is None:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        return queryset.filter(id__in=MatchedRowids(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match]
+        )).annotate(search_score=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 1.0, {GROUP_TITLE_WEIGHT}.0) '
+            f'FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [match], output_field=FloatField()
+        ))
+
+
+class InvertedIndexBackend:
+    """Поиск по обратному индексу, построенному на Python."""
+
+    def index_posts(self, posts: Iterable[Post]) -> None:
+        posts = list(posts)
+        terms = [
+            SearchTerm(term=term[:100], post_id=post.id, weight=weight)
+            for post in posts
+            for term, weight in post_weights(post).items()
+        ]
+        with transaction.atomic():
+            SearchTerm.objects.filter(post__in=posts).delete()
+            SearchTerm.objects.bulk_create(
+                terms, batch_size=500, ignore_conflicts=True)
+
+    def remove_post(self, post_id: int) -> None:
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def clear(self) -> None:
+        SearchTerm.objects.all().delete()
+
+    def _matches(self, terms: set) -> QuerySet:
+        return (SearchTerm.objects.filter(term__in=terms)
+                .values('post')
+                .annotate(score=Sum('weight'), matched=Count('term'))
+                .filter(matched=len(terms)))
+
+    def search(self, query: str, limit: int) -> List[int]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        return list(
+            self._matches(terms)
+            .order_by('-score', '-post_id')
+            .values_list('post', flat=True)[:limit]
+        )
+
+    def filter_queryset(self, queryset: QuerySet, query: str) -> QuerySet:
+        terms = set(tokenize(query))
+        if not terms:
+            return queryset.none()
+        matches = self._matches(terms)
+        return queryset.filter(id__in=matches.values('post')).annotate(
+            search_score=Subquery(
+                matches.filter(post=OuterRef('pk')).values('score'),
+                output_field=FloatField()))
+
+
+def get_backend():
+    """Возвращает поисковый индекс согласно SEARCH_BACKEND."""
+    name = settings.SEARCH_BACKEND
+    if name == 'auto':
+        name = 'fts5' if fts_available() else 'inverted'
+    if name == 'fts5':
+        return FTS5Backend()
+    return InvertedIndexBackend()
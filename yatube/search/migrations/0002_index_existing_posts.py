@@ -0,0 +1,75 @@
+import re
+from collections import Counter
+
+from django.db import migrations
+
+# Копия нормализатора и формата индекса из search.backends на момент
+# миграции: миграция не должна зависеть от живого кода и моделей.
+FTS_TABLE = 'search_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+GROUP_TITLE_WEIGHT = 3
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def group_title(post):
+    return post.group.title if post.group_id else ''
+
+
+def fts_row(post):
+    return (post.id, ' '.join(tokenize(post.text)),
+            ' '.join(tokenize(group_title(post))))
+
+
+def post_weights(post):
+    weights = Counter(tokenize(post.text))
+    for term in tokenize(group_title(post)):
+        weights[term] += GROUP_TITLE_WEIGHT
+    return weights
+
+
+def index_existing_posts(apps, schema_editor):
+    """Индексирует посты тем же нормализатором, что и поиск."""
+    Post = apps.get_model('posts', 'Post')
+    SearchTerm = apps.get_model('search', 'SearchTerm')
+    connection = schema_editor.connection
+    use_fts = (connection.vendor == 'sqlite'
+               and FTS_TABLE in connection.introspection.table_names())
+    alias = connection.alias
+    posts = Post.objects.using(alias).select_related('group').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(posts.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        if use_fts:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                    [(post.id,) for post in batch])
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, text, group_title) '
+                    f'VALUES (%s, %s, %s)',
+                    [fts_row(post) for post in batch])
+            continue
+        SearchTerm.objects.using(alias).filter(post__in=batch).delete()
+        SearchTerm.objects.using(alias).bulk_create([
+            SearchTerm(term=term[:100], post_id=post.id, weight=weight)
+            for post in batch
+            for term, weight in post_weights(post).items()
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
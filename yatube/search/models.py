@@ -0,0 +1,23 @@
+from django.db import models
+
+from posts.models import Post
+
+
+class SearchTerm(models.Model):
+    """Запись обратного индекса: слово, пост и вес слова в посте."""
+    term = models.CharField('Слово', max_length=100)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Пост'
+    )
+    weight = models.PositiveIntegerField('Вес')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'post'],
+                                    name='unique search term')
+        ]
+        verbose_name = 'Слово индекса'
+        verbose_name_plural = 'Слова индекса'
@@ -0,0 +1,60 @@
+"""Обновление поискового индекса при изменении постов и групп"""
+
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts.models import Group, Post
+from search.backends import get_backend
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    """Переиндексирует сохраненный пост."""
+    get_backend().index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post(sender, instance, **kwargs):
+    """Убирает удаленный пост из индекса."""
+    get_backend().remove_post(instance.id)
+
+
+def reindex_group_posts(group_id: int) -> None:
+    """Переиндексирует посты группы пачками по SEARCH_REINDEX_BATCH_SIZE."""
+    backend = get_backend()
+    posts = Post.objects.filter(group_id=group_id).select_related(
+        'group').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(posts.filter(
+            id__gt=last_id)[:settings.SEARCH_REINDEX_BATCH_SIZE])
+        if not batch:
+            return
+        backend.index_posts(batch)
+        last_id = batch[-1].id
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_title(sender, instance, **kwargs):
+    """Запоминает прежние название и slug редактируемой группы."""
+    instance._old_title = None
+    if instance.pk:
+        instance._old_title = Group.objects.filter(
+            pk=instance.pk).values_list('title', 'slug').first()
+
+
+@receiver(post_save, sender=Group)
+def index_group_posts(sender, instance, created, **kwargs):
+    """Переиндексирует посты группы после смены ее названия или slug.
+
+    Постов у группы может быть много, поэтому индекс обновляется после
+    коммита и пачками.
+    """
+    old = getattr(instance, '_old_title', None)
+    if created or old is None or old == (instance.title, instance.slug):
+        return
+    transaction.on_commit(partial(reindex_group_posts, instance.pk))
@@ -0,0 +1,142 @@
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Group, Post
+from search.backends import (FTS5Backend, InvertedIndexBackend,
+                             fts_available, get_backend)
+
+User = get_user_model()
+
+
+class SearchBackendTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Кошки',
+            description='Тестовый текст',
+            slug='cats'
+        )
+
+    def check_backend(self):
+        plain = Post.objects.create(author=self.author,
+                                    text='Пост про кошки и собак')
+        in_group = Post.objects.create(author=self.author, group=self.group,
+                                       text='Пост про кошки')
+        Post.objects.create(author=self.author, text='Пост про птиц')
+        backend = get_backend()
+        self.assertEqual(backend.search('кошки', 10),
+                         [in_group.id, plain.id])
+        self.assertEqual(backend.search('Собак кошки', 10), [plain.id])
+        plain.text = 'Пост про птиц'
+        plain.save()
+        self.assertEqual(backend.search('собак', 10), [])
+        in_group.delete()
+        self.assertEqual(backend.search('кошки', 10), [])
+
+    def test_fts5_backend(self):
+        """Индекс FTS5 обновляется при сохранении и ранжирует выдачу."""
+        self.assertTrue(fts_available())
+        self.assertIsInstance(get_backend(), FTS5Backend)
+        self.check_backend()
+
+    @override_settings(SEARCH_BACKEND='inverted')
+    def test_inverted_index_backend(self):
+        """Запасной обратный индекс дает ту же выдачу."""
+        self.check_backend()
+
+    def test_group_rename_reindexes_posts(self):
+        """Переименование группы обновляет индекс ее постов."""
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Пост')
+        self.group.title = 'Собаки'
+        self.group.save()
+        self.assertEqual(get_backend().search('собаки', 10), [post.id])
+
+    @override_settings(SEARCH_REINDEX_BATCH_SIZE=1)
+    def test_group_reindexed_only_on_title_change(self):
+        """Посты переиндексируются пачками и только при смене названия."""
+        posts = [Post.objects.create(author=self.author, group=self.group,
+                                     text='Пост') for _ in range(2)]
+        group = Group.objects.get(pk=self.group.pk)
+        with patch.object(FTS5Backend, 'index_posts') as fts_index, \
+                patch.object(InvertedIndexBackend,
+                             'index_posts') as term_index:
+            group.description = 'Новое описание'
+            group.save()
+            group.title = 'Собаки'
+            group.save()
+        calls = fts_index.call_args_list + term_index.call_args_list
+        self.assertEqual([call[0][0] for call in calls],
+                         [[posts[0]], [posts[1]]])
+
+    def test_migration_indexes_normalized_text(self):
+        """Миграция индексирует посты тем же нормализатором, что и поиск."""
+        post = Post.objects.create(author=self.author, text='Ёлка')
+        get_backend().clear()
+        migration = import_module(
+            'search.migrations.0002_index_existing_posts')
+        migration.index_existing_posts(
+            apps, SimpleNamespace(connection=connection))
+        self.assertEqual(get_backend().search('елка', 10), [post.id])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        post = Post.objects.create(author=self.author, text='Пост про кошки')
+        get_backend().clear()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(get_backend().search('кошки', 10), [post.id])
+
+
+class SearchViewTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='Admin', email='admin@mail.com', password='1234')
+        cls.post = Post.objects.create(author=cls.admin,
+                                       text='Пост про кошки')
+        Post.objects.create(author=cls.admin, text='Пост про птиц')
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты."""
+        response = self.client.get(reverse('search:index'), {'q': 'кошки'})
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет через поисковый индекс."""
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кошки'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.post])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_admin_search_is_ranked_and_complete(self):
+        """Админка показывает все найденные посты по релевантности."""
+        group = Group.objects.create(title='Кошки', slug='cats',
+                                     description='Текст')
+        in_group = Post.objects.create(author=self.admin, group=group,
+                                       text='Еще пост про кошки')
+        self.client.force_login(self.admin)
+        for backend in ('fts5', 'inverted'):
+            with self.subTest(backend=backend), \
+                    self.settings(SEARCH_BACKEND=backend):
+                if backend == 'inverted':
+                    call_command('rebuild_search_index', stdout=StringIO())
+                response = self.client.get(
+                    reverse('admin:posts_post_changelist'), {'q': 'кошки'})
+                self.assertEqual(list(response.context['cl'].result_list),
+                                 [in_group, self.post])
@@ -0,0 +1,33 @@
+"""Поиск по постам"""
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import render
+from django.utils.http import urlencode
+
+from posts.models import Post
+from search.backends import get_backend
+
+
+def search(request: HttpRequest) -> HttpResponse:
+    """Рендер страницы результатов поиска."""
+    template = 'search/results.html'
+    query: str = request.GET.get('q', '').strip()
+    post_ids = []
+    if query:
+        post_ids = get_backend().search(query, settings.SEARCH_MAX_RESULTS)
+    paginator = Paginator(post_ids, settings.POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    posts = Post.objects.for_feed().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[post_id] for post_id in page_obj.object_list
+        if post_id in posts
+    ]
+    context = {
+        'text': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, template, context)
@@ -0,0 +1,81 @@
+"""Кешированный поиск пользователей по id и имени.
+
+Пользователь хранится в кеше по умолчанию: сначала в памяти процесса
+(LRU локального уровня TieredCache), затем в общем кеше, так что
+популярные профили почти не доходят до базы. Имя пользователя хранится
+отдельным ключом со ссылкой на id. Записи сбрасываются сигналами при
+сохранении и удалении пользователя (users.signals).
+
+Пароль в кеш не попадает: объекты загружаются с defer('password'),
+и save() на таком объекте не перезапишет пароль. База, из которой
+пользователь прочитан, тоже не запоминается: иначе связанные с ним
+запросы шли бы в реплику и тогда, когда запрос закреплен за основной
+базой.
+"""
+
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+
+User = get_user_model()
+
+
+def id_key(user_id: int) -> str:
+    return f'user:id:{user_id}'
+
+
+def name_key(username: str) -> str:
+    return f'user:name:{username}'
+
+
+def _detached(user: Optional[User]) -> Optional[User]:
+    """Пользователь без привязки к базе, из которой его прочитали."""
+    if user is not None:
+        user._state.db = None
+    return user
+
+
+def _load(**lookup) -> Optional[User]:
+    user = _detached(User.objects.defer('password').filter(**lookup).first())
+    if user is not None:
+        cache.set_many({
+            id_key(user.pk): user,
+            name_key(user.get_username()): user.pk,
+        }, settings.USER_CACHE_TTL)
+    return user
+
+
+def get_user(user_id: int) -> Optional[User]:
+    """Пользователь по id или None."""
+    user = cache.get(id_key(user_id))
+    if user is None:
+        return _load(pk=user_id)
+    return _detached(user)
+
+
+def get_user_by_username(username: str) -> Optional[User]:
+    """Пользователь по имени или None."""
+    user_id = cache.get(name_key(username))
+    if user_id is not None:
+        user = get_user(user_id)
+        # После переименования старое имя еще может ссылаться на id.
+        if user is not None and user.get_username() == username:
+            return user
+        cache.delete(name_key(username))
+    return _load(username=username)
+
+
+def get_user_or_404(username: str) -> User:
+    """Как get_object_or_404(User, username=username), но через кеш."""
+    user = get_user_by_username(username)
+    if user is None:
+        raise Http404(f'Пользователь {username} не найден.')
+    return user
+
+
+def forget_user(user: User) -> None:
+    """Сбрасывает закешированного пользователя."""
+    cache.delete_many([id_key(user.pk), name_key(user.get_username())])
@@ -0,0 +1,202 @@
+"""Сессии в общем кеше с отложенной записью в базу.
+
+Движок для SESSION_ENGINE = 'users.sessions'. Сессия читается из кеша
+SESSION_CACHE_ALIAS и только при промахе - из базы. Сохранение пишет
+в кеш сразу, а в базу - пачкой в фоновом потоке через
+SESSION_WRITE_DELAY секунд, объединяя повторные сохранения одной
+сессии. Сохранение без изменений данных пропускается, если не включен
+SESSION_SAVE_EVERY_REQUEST: тогда оно продлевает срок сессии. Пока
+запись не дошла до базы, сессия этого процесса читается из очереди.
+
+Очередь у каждого процесса своя, а выйти пользователь может через
+другой процесс. Поэтому удаление оставляет в общем кеше метку на
+SESSION_TOMBSTONE_TTL секунд, и запись очереди пропускает помеченные
+сессии, а если удаление пришлось на саму запись - удаляет их снова.
+
+При SESSION_WRITE_BEHIND = False запись в базу идет сразу.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore,
+)
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import connection, transaction
+
+logger = logging.getLogger('yatube.sessions')
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Dict[str, Session] = {}
+_pending_lock = threading.Lock()
+_write_lock = threading.Lock()
+_flush_scheduled = False
+
+TOMBSTONE_KEY = 'users.sessions.deleted:{}'
+
+
+def _tombstones():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def bury(session_key: str) -> None:
+    """Помечает сессию удаленной для очередей всех процессов."""
+    _tombstones().set(TOMBSTONE_KEY.format(session_key), True,
+                      settings.SESSION_TOMBSTONE_TTL)
+
+
+def buried(session_keys: Iterable[str]) -> Set[str]:
+    """Ключи сессий, удаленных в любом процессе."""
+    keys = {TOMBSTONE_KEY.format(key): key for key in session_keys}
+    if not keys:
+        return set()
+    return {keys[key] for key in _tombstones().get_many(list(keys))}
+
+
+def write_sessions(sessions: Iterable[Session]) -> None:
+    """Записывает сессии в базу: существующие обновляет, новые вставляет."""
+    sessions = list(sessions)
+    if not sessions:
+        return
+    with transaction.atomic():
+        existing = set(Session.objects.filter(
+            session_key__in=[session.session_key for session in sessions]
+        ).values_list('session_key', flat=True))
+        Session.objects.bulk_update(
+            [session for session in sessions
+             if session.session_key in existing],
+            ['session_data', 'expire_date'])
+        Session.objects.bulk_create(
+            [session for session in sessions
+             if session.session_key not in existing],
+            ignore_conflicts=True)
+
+
+def flush_pending() -> None:
+    """Записывает в базу все сессии из очереди, кроме удаленных."""
+    global _flush_scheduled
+    with _write_lock:
+        with _pending_lock:
+            sessions = list(_pending.values())
+            _pending.clear()
+            _flush_scheduled = False
+        try:
+            deleted = buried(session.session_key for session in sessions)
+            sessions = [session for session in sessions
+                        if session.session_key not in deleted]
+            write_sessions(sessions)
+            # Удаление в другом процессе могло пройти между проверкой
+            # меток и записью: метка ставится до удаления из базы.
+            deleted = buried(session.session_key for session in sessions)
+            if deleted:
+                Session.objects.filter(session_key__in=deleted).delete()
+        except Exception:
+            logger.exception('Не удалось записать %d сессий', len(sessions))
+
+
+def _flush_in_worker() -> None:
+    time.sleep(settings.SESSION_WRITE_DELAY)
+    try:
+        flush_pending()
+    finally:
+        connection.close()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix='sessions')
+    return _executor
+
+
+def queue_write(session: Session) -> None:
+    """Ставит сессию в очередь записи в базу."""
+    global _flush_scheduled
+    if not settings.SESSION_WRITE_BEHIND:
+        write_sessions([session])
+        return
+    with _pending_lock:
+        _pending[session.session_key] = session
+        if _flush_scheduled:
+            return
+        _flush_scheduled = True
+    get_executor().submit(_flush_in_worker)
+
+
+def pending_session(session_key: str) -> Optional[Session]:
+    with _pending_lock:
+        session = _pending.get(session_key)
+    if session is None or buried([session_key]):
+        return None
+    return session
+
+
+def discard_pending(session_key: str) -> None:
+    with _pending_lock:
+        _pending.pop(session_key, None)
+
+
+atexit.register(flush_pending)
+
+
+class SessionStore(CachedDBStore):
+    """Сессия в кеше с отложенной записью в базу."""
+    cache_key_prefix = 'users.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._snapshot: Optional[bytes] = None
+
+    def _serialized(self, data: dict) -> bytes:
+        return self.serializer().dumps(data)
+
+    def _get_session_from_db(self):
+        session = pending_session(self.session_key)
+        if session is not None:
+            return session
+        return super()._get_session_from_db()
+
+    def load(self):
+        data = super().load()
+        self._snapshot = self._serialized(data)
+        return data
+
+    def exists(self, session_key):
+        return (pending_session(session_key) is not None
+                or super().exists(session_key))
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if (not must_create and self._snapshot is not None
+                and not settings.SESSION_SAVE_EVERY_REQUEST
+                and self._serialized(data) == self._snapshot):
+            return
+        if must_create:
+            if not self._cache.add(self.cache_key, data,
+                                   self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+        self._snapshot = self._serialized(data)
+        queue_write(self.create_model_instance(data))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        bury(session_key)
+        with _write_lock:
+            discard_pending(session_key)
+            super().delete(session_key)
@@ -0,0 +1,16 @@
+"""Обработчики сигналов модели пользователя"""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.lookup import forget_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_changed_user(sender, instance, **kwargs):
+    """Сбрасывает пользователя в кеше поиска после изменения."""
+    forget_user(instance)
@@ -1 +1,188 @@
-# Create your tests here.
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from users import sessions
+from users.lookup import get_user, get_user_by_username, get_user_or_404
+from users.sessions import SessionStore
+
+User = get_user_model()
+
+
+class SessionStoreTests(TestCase):
+
+    def test_reads_from_cache(self):
+        """Сохраненная сессия читается из кеша без запросов к базе."""
+        store = SessionStore()
+        store['answer'] = 42
+        store.save()
+        self.assertTrue(Session.objects.filter(
+            session_key=store.session_key).exists())
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(store.session_key)['answer'], 42)
+
+    def test_falls_back_to_database(self):
+        """При промахе кеша сессия берется из базы."""
+        store = SessionStore()
+        store['answer'] = 42
+        store.save()
+        caches['shared'].clear()
+        self.assertEqual(SessionStore(store.session_key)['answer'], 42)
+
+    def test_unchanged_save_is_skipped(self):
+        """Сохранение без изменений не пишет ни в кеш, ни в базу."""
+        store = SessionStore()
+        store['answer'] = 42
+        store.save()
+        loaded = SessionStore(store.session_key)
+        loaded['answer'] = 42
+        with mock.patch.object(sessions, 'queue_write') as queue_write:
+            loaded.save()
+            queue_write.assert_not_called()
+            loaded['answer'] = 43
+            loaded.save()
+            queue_write.assert_called_once()
+
+    @override_settings(SESSION_WRITE_BEHIND=True)
+    def test_write_behind(self):
+        """Отложенная запись видна процессу до того, как дошла до базы."""
+        with mock.patch.object(sessions, 'get_executor') as get_executor:
+            store = SessionStore()
+            store['answer'] = 42
+            store.save()
+            get_executor.return_value.submit.assert_called_once()
+        self.assertFalse(Session.objects.filter(
+            session_key=store.session_key).exists())
+        caches['shared'].clear()
+        self.assertEqual(SessionStore(store.session_key)['answer'], 42)
+        sessions.flush_pending()
+        self.assertTrue(Session.objects.filter(
+            session_key=store.session_key).exists())
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_unchanged_save_renews_expiry(self):
+        """С SESSION_SAVE_EVERY_REQUEST каждое сохранение продлевает срок."""
+        store = SessionStore()
+        store['answer'] = 42
+        store.save()
+        loaded = SessionStore(store.session_key)
+        loaded['answer'] = 42
+        with mock.patch.object(sessions, 'queue_write') as queue_write:
+            loaded.save()
+            queue_write.assert_called_once()
+
+    @override_settings(SESSION_WRITE_BEHIND=True)
+    def test_delete_in_other_process_wins(self):
+        """Выход через другой процесс не отменяется очередью этого."""
+        with mock.patch.object(sessions, 'get_executor'):
+            store = SessionStore()
+            store['answer'] = 42
+            store.save()
+        # Очередь другого процесса удаление не видит.
+        with mock.patch.object(sessions, 'discard_pending'):
+            SessionStore(store.session_key).delete()
+        caches['shared'].delete(store.cache_key)
+        self.assertNotIn('answer', SessionStore(store.session_key))
+        sessions.flush_pending()
+        self.assertFalse(Session.objects.filter(
+            session_key=store.session_key).exists())
+
+    def test_delete(self):
+        """Удаленная сессия пропадает из кеша и базы."""
+        store = SessionStore()
+        store['answer'] = 42
+        store.save()
+        store.delete()
+        self.assertFalse(SessionStore().exists(store.session_key))
+        self.assertNotIn('answer', SessionStore(store.session_key))
+
+
+class SessionFlushRaceTests(TransactionTestCase):
+
+    @override_settings(SESSION_WRITE_BEHIND=True)
+    def test_delete_during_flush_wins(self):
+        """Выход во время записи очереди не воскрешает сессию."""
+        with mock.patch.object(sessions, 'get_executor'):
+            store = SessionStore()
+            store['answer'] = 42
+            store.save()
+        logout = threading.Thread(target=store.delete)
+        write_sessions = sessions.write_sessions
+
+        def write_during_logout(pending):
+            logout.start()
+            logout.join(0.2)
+            write_sessions(pending)
+
+        with mock.patch.object(sessions, 'write_sessions',
+                               write_during_logout):
+            sessions.flush_pending()
+        logout.join()
+        self.assertFalse(Session.objects.filter(
+            session_key=store.session_key).exists())
+
+
+class PurgeSessionsTests(TestCase):
+
+    def test_purges_expired_sessions(self):
+        """Команда удаляет только истекшие сессии."""
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{number}', session_data='',
+                    expire_date=now - timedelta(days=1))
+            for number in range(5)
+        ] + [Session(session_key='alive', session_data='',
+                     expire_date=now + timedelta(days=1))])
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertIn('5', out.getvalue())
+        self.assertEqual(
+            list(Session.objects.values_list('session_key', flat=True)),
+            ['alive'])
+
+
+class UserLookupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Author',
+                                             password='secret')
+
+    def test_cached_after_first_lookup(self):
+        """Повторный поиск по имени и id обходится без базы."""
+        self.assertEqual(get_user_by_username('Author'), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_by_username('Author'), self.user)
+            self.assertEqual(get_user(self.user.id), self.user)
+
+    def test_password_is_not_cached(self):
+        """Пароль не попадает в кеш и не затирается при сохранении."""
+        user = get_user(self.user.id)
+        self.assertNotIn('password', user.__dict__)
+        user.first_name = 'Лев'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_invalidated_on_save(self):
+        """Сохранение и удаление пользователя сбрасывают кеш."""
+        get_user_by_username('Author')
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertEqual(get_user_by_username('Author').first_name, 'Лев')
+        self.user.username = 'Writer'
+        self.user.save()
+        self.assertIsNone(get_user_by_username('Author'))
+        self.assertEqual(get_user_by_username('Writer'), self.user)
+        self.user.delete()
+        self.assertIsNone(get_user_by_username('Writer'))
+        with self.assertRaises(Http404):
+            get_user_or_404('Writer')
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,10 +47,14 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'search.apps.SearchConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.db.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,13 +91,119 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Профиль базы выбирается переменной окружения DB_ENGINE:
+# sqlite (по умолчанию) или postgresql.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.postgresql',
+            'NAME': os.getenv('DB_NAME', 'yatube'),
+            'USER': os.getenv('DB_USER', 'yatube'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'OPTIONS': {
+                'pool_min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                'pool_max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': os.getenv('DB_NAME',
+                              os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'OPTIONS': {
+                # Секунды; отсюда же берется PRAGMA busy_timeout.
+                'timeout': int(
+                    os.getenv('SQLITE_BUSY_TIMEOUT', '20000')) / 1000,
+                'pragmas': {
+                    'mmap_size': int(
+                        os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 ** 2))),
+                },
+            },
+        }
+    }
+
+# Реплики для чтения: DB_REPLICA_NAMES - имена баз через запятую с теми же
+# параметрами подключения, что и у основной. В тестах реплики зеркалят
+# основную базу.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.getenv('DB_REPLICA_NAMES', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS: int = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# Кеш по умолчанию двухуровневый (core.cache.TieredCache): LRU внутри
+# процесса перед общим для всех процессов кешем. Общий кеш файловый
+# (CACHE_DIR) или Redis, если задан CACHE_REDIS_URL (нужен django-redis).
+# Ключи всех экземпляров приложения разделяются CACHE_KEY_PREFIX.
+
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'CACHE_DIR', os.path.join(tempfile.gettempdir(), 'yatube-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'yatube'),
+        'OPTIONS': {
+            'LOCAL': 'local',
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', '5')),
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube-local',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'shared': SHARED_CACHE,
 }
 
+# Сессии живут в общем кеше и пишутся в базу отложенно, см. users.sessions.
+SESSION_ENGINE = 'users.sessions'
+SESSION_CACHE_ALIAS = 'shared'
+SESSION_WRITE_BEHIND: bool = not DEBUG
+SESSION_WRITE_DELAY: float = 1.0
+# Сколько помнить об удаленной сессии, чтобы отложенная запись другого
+# процесса ее не вернула.
+SESSION_TOMBSTONE_TTL: int = 3600
+
+# Кеш поиска пользователей по id и имени, см. users.lookup.
+USER_CACHE_TTL: int = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -141,6 +252,107 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_PER_PAGE: int = 10
+POSTS_CURSOR_PAGINATION: bool = False
+COMMENTS_PER_PAGE: int = 20
+FEED_CACHE_TTL: int = 60 * 60
+FRAGMENT_CACHE_STALE: int = 60
+FRAGMENT_CACHE_BETA: float = 1.0
+FRAGMENT_CACHE_WAIT: float = 2.0
+APPROXIMATE_COUNT_MIN: int = 1000
+POSTS_TOTAL_TTL: int = 5 * 60
+
+SEARCH_BACKEND: str = 'auto'
+SEARCH_MAX_RESULTS: int = 1000
+SEARCH_REINDEX_BATCH_SIZE: int = 500
+
+THUMBNAIL_ASYNC: bool = not DEBUG
+THUMBNAIL_WORKERS: int = 2
+THUMBNAIL_LOOKUP_TTL: int = 60 * 60
+
+EXPORT_CHUNK_SIZE: int = 2000
+
+# Ошибка потокового рендера после начала ответа не станет страницей 500;
+# для отладки таких ошибок режим можно выключить.
+STREAMING_RENDER: bool = True
+STREAMING_BUFFER_SIZE: int = 16 * 1024
+STREAMING_CHUNK_SIZE: int = 500
+
+API_MAX_LIMIT: int = 100
+API_QUERY_MAX_DEPTH: int = 5
+API_QUERY_MAX_COST: int = 2500
+
+PROFILING_SAMPLE_RATE: float = 1.0 if DEBUG else 0.05
+PROFILING_SLOW_REQUEST_MS: int = 500
+PROFILING_SLOW_QUERY_MS: int = 100
+PROFILING_TOP_QUERIES: int = 5
+PROFILING_LOG_FILE = os.path.join(BASE_DIR, 'profiling.log')
+
+# Сколько SQL-запросов может выполнить страница в тестах при обычной
+# работе (счетчики пользователей созданы, миниатюры готовы),
+# см. core.query_budget.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_list': 5,
+    'posts:profile': 5,
+    'posts:post_detail': 4,
+    'posts:comment_list': 2,
+    'posts:follow_index': 5,
+    'posts:post_create': 2,
+    'POST posts:post_create': 10,
+    'posts:post_edit': 4,
+    'POST posts:post_edit': 10,
+    'POST posts:add_comment': 3,
+    'posts:profile_follow': 12,
+    'posts:profile_unfollow': 10,
+    'posts:export': 2,
+    'search:index': 2,
+    'api:posts': 1,
+    'POST api:posts': 11,
+    'api:post_detail': 1,
+    'api:comments': 2,
+    'POST api:comments': 4,
+    'api:group_posts': 2,
+    'api:user_posts': 5,
+    'api:follow_feed': 3,
+    'api:follow': 12,
+    'api:query': 9,
+}
+
+# Бюджеты холодного пути: запросы с загруженными файлами (генерация
+# миниатюр) и запросы внутри core.query_budget.cold_path(), например
+# пересчет счетчиков по реплике, где их строки еще нет.
+COLD_QUERY_BUDGETS = {
+    'posts:profile': 10,
+    'POST posts:post_create': 27,
+    'POST posts:post_edit': 27,
+}
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'profiling': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': PROFILING_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'encoding': 'utf-8',
+        },
+    },
+    'loggers': {
+        'yatube.profiling': {
+            'handlers': ['profiling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+TIMELINE_CELEBRITY_FOLLOWERS: int = 1000
+TIMELINE_BATCH_SIZE: int = 500
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 